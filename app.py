@@ -1,9 +1,30 @@
-from flask import Flask, render_template, request, send_file, redirect, url_for, session, flash
+from flask import Flask, render_template, request, send_file, redirect, url_for, session, flash, Response, stream_with_context, jsonify
 from werkzeug.security import check_password_hash, generate_password_hash
 from datetime import datetime
+import io
 import os
 from database import db, Receipt, Expense, Client
-from sqlalchemy import func, text
+from sqlalchemy import text
+import reporting
+import rollup
+import pdf_cache
+import pdf_renderer
+import receipt_pdf
+import render_queue
+import billing
+import receivables
+import exports
+import imports
+import numbering
+import auth
+import history
+import client_search
+import client_cache
+import client_revenue
+import text_search
+import money
+import instrumentation
+import profiler
 import secrets
 
 app = Flask(__name__)
@@ -16,22 +37,17 @@ database_url = os.getenv('DATABASE_URL') or 'sqlite:///data.db'
 app.config['SQLALCHEMY_DATABASE_URI'] = database_url
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
+app.add_template_filter(money.format_amount, 'money')
 
-with app.app_context():
-    db.create_all()
+# Opt-in cProfile sampling of requests (see profiler.py)
+if profiler.enabled():
+    app.wsgi_app = profiler.ProfilerMiddleware(app.wsgi_app)
 
-    # Ensure an initial admin user exists (username 'admin', password 'admin')
-    try:
-        from database import User
-        admin = User.query.filter_by(username='admin').first()
-        if not admin:
-            admin_user = User(username='admin', password_hash=generate_password_hash('admin'))
-            db.session.add(admin_user)
-            db.session.commit()
-            print("Created initial admin user with username 'admin' and password 'admin'")
-    except Exception:
-        # If DB not ready or other error, ignore here; app will create on demand
-        pass
+# The schema is managed by migrations.py (scripts/migrate.py): importing the
+# app does no database work
+with app.app_context():
+    # Server-Timing headers and /metrics (see instrumentation.py)
+    instrumentation.init_app(app, db.engine)
 
 from database import User
 
@@ -43,6 +59,10 @@ def login_required(f):
     def decorated(*args, **kwargs):
         if not session.get('logged_in'):
             return redirect(url_for('login', next=request.path))
+        if auth.current_user() is None:
+            # The account was deleted since this session was opened
+            session.clear()
+            return redirect(url_for('login', next=request.path))
         return f(*args, **kwargs)
     return decorated
 
@@ -58,8 +78,7 @@ def login():
         password = request.form.get('password', '')
         user = User.query.filter_by(username=username).first()
         if user and check_password_hash(user.password_hash, password):
-            session['logged_in'] = True
-            session['username'] = username
+            auth.login_user(user)
             # If a next_url was provided and is valid, honor it. Otherwise, admins land on the admin UI.
             if next_url and next_url != 'None':
                 return redirect(next_url)
@@ -82,14 +101,13 @@ def logout():
 def admin():
     # Serve a login form at /admin for unauthenticated users so the URL stays clean.
     # If a POST is received here, attempt login; only the admin user may access management.
-    if request.method == 'POST' and not (session.get('logged_in') and session.get('username') == 'admin'):
+    if request.method == 'POST' and not (session.get('logged_in') and auth.is_admin()):
         # Handle login attempt posted to /admin (only when not already logged-in as admin)
         username = request.form.get('username', '')
         password = request.form.get('password', '')
         user = User.query.filter_by(username=username).first()
         if user and check_password_hash(user.password_hash, password):
-            session['logged_in'] = True
-            session['username'] = username
+            auth.login_user(user)
             flash('Connexion réussie.', 'success')
             # Only allow admin user onto the admin UI
             if username != 'admin':
@@ -102,11 +120,11 @@ def admin():
             # fall through to render login form again (still at /admin)
 
     # If the user is not logged in or not admin, show login form (but keep URL /admin)
-    if not session.get('logged_in') or session.get('username') != 'admin':
+    if not session.get('logged_in') or not auth.is_admin():
         return render_template('login.html', next='/admin', action_url=url_for('admin'))
 
     # At this point user is logged in as admin and can manage users
-    if request.method == 'POST' and (session.get('logged_in') and session.get('username') == 'admin'):
+    if request.method == 'POST' and (session.get('logged_in') and auth.is_admin()):
         # This block handles creating users when an authenticated admin posts the create form
         username = request.form.get('username', '').strip()
         password = request.form.get('password', '').strip()
@@ -125,11 +143,38 @@ def admin():
     return render_template('admin.html', users=users)
 
 
+@app.route('/admin/profiles')
+@login_required
+def admin_profiles():
+    """List the request profiles recorded by the profiler middleware."""
+    if not auth.is_admin():
+        flash('Accès administrateur requis', 'danger')
+        return redirect(url_for('index'))
+    return render_template('admin_profiles.html', profiles=profiler.list_profiles(),
+                           enabled=profiler.enabled(), sample_rate=profiler.SAMPLE_RATE,
+                           slow_ms=profiler.SLOW_MS, paths=profiler.PATHS, max_files=profiler.MAX_FILES)
+
+
+@app.route('/admin/profiles/<name>')
+@login_required
+def admin_profile(name):
+    """Download a profile (pstats), or its text summary with ?format=text."""
+    if not auth.is_admin():
+        flash('Accès administrateur requis', 'danger')
+        return redirect(url_for('index'))
+    if not profiler.is_valid_name(name) or not os.path.exists(profiler.path_for(name)):
+        flash('Profil introuvable', 'danger')
+        return redirect(url_for('admin_profiles'))
+    if request.args.get('format') == 'text':
+        return Response(profiler.summary(name), mimetype='text/plain')
+    return send_file(profiler.path_for(name), as_attachment=True, download_name=name)
+
+
 @app.route('/admin/delete', methods=['POST'])
 @login_required
 def admin_delete():
     # Only admin username may perform deletions
-    if session.get('username') != 'admin':
+    if not auth.is_admin():
         flash('Accès administrateur requis', 'danger')
         return redirect(url_for('index'))
 
@@ -147,28 +192,55 @@ def admin_delete():
         flash('Impossible de supprimer le compte administrateur', 'danger')
         return redirect(url_for('admin'))
 
+    # Receipts and expenses of a deleted user are kept with user_id NULL
+    rollup.reassign_user(user.id, None)
     db.session.delete(user)
     db.session.commit()
+    auth.invalidate(user.id)
     flash(f'Utilisateur {user.username} supprimé', 'success')
     return redirect(url_for('admin'))
 
 
+CLIENTS_PAGE_SIZE = 50
+
+
 @app.route('/clients')
 @login_required
 def clients():
     # Only admin can access client management
-    if session.get('username') != 'admin':
+    if not auth.is_admin():
         flash('Accès administrateur requis', 'danger')
         return redirect(url_for('index'))
     
-    clients = Client.query.order_by(Client.created_at.desc()).all()
-    return render_template('clients.html', clients=clients)
+    # Only the most recent clients are listed; the others are found through the search box
+    clients = Client.query.order_by(Client.created_at.desc()).limit(CLIENTS_PAGE_SIZE).all()
+    total_clients = db.session.scalar(db.select(db.func.count(Client.id)))
+    revenue = client_revenue.summaries(client.id for client in clients)
+    return render_template('clients.html', clients=clients, total_clients=total_clients, revenue=revenue,
+                           current_month=datetime.now().strftime('%Y-%m'))
+
+
+@app.route('/clients/<int:client_id>')
+@login_required
+def client_detail(client_id):
+    """A client's revenue: lifetime total, last payment and the last 12 months."""
+    if not auth.is_admin():
+        flash('Accès administrateur requis', 'danger')
+        return redirect(url_for('index'))
+
+    client = Client.query.get_or_404(client_id)
+    summary = client_revenue.summaries([client.id])[client.id]
+    months = client_revenue.monthly(client.id)
+    recent_receipts = (Receipt.query.filter_by(client_id=client.id)
+                       .order_by(Receipt.date.desc(), Receipt.id.desc()).limit(10).all())
+    return render_template('client_detail.html', client=client, summary=summary, months=months,
+                           recent_receipts=recent_receipts)
 
 
 @app.route('/clients/add', methods=['POST'])
 @login_required
 def clients_add():
-    if session.get('username') != 'admin':
+    if not auth.is_admin():
         flash('Accès administrateur requis', 'danger')
         return redirect(url_for('index'))
     
@@ -186,8 +258,8 @@ def clients_add():
     
     try:
         start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-        installation_fee_val = float(installation_fee) if installation_fee else 0.0
-        monthly_payment_val = float(monthly_payment) if monthly_payment else 0.0
+        installation_fee_val = money.parse_amount(installation_fee, default=0)
+        monthly_payment_val = money.parse_amount(monthly_payment, default=0)
         
         new_client = Client(
             name=name,
@@ -199,6 +271,7 @@ def clients_add():
             status=status
         )
         db.session.add(new_client)
+        client_cache.bump()
         db.session.commit()
         flash(f'Client {name} créé avec succès', 'success')
     except ValueError as e:
@@ -210,7 +283,7 @@ def clients_add():
 @app.route('/clients/edit/<int:client_id>', methods=['POST'])
 @login_required
 def clients_edit(client_id):
-    if session.get('username') != 'admin':
+    if not auth.is_admin():
         flash('Accès administrateur requis', 'danger')
         return redirect(url_for('index'))
     
@@ -220,12 +293,12 @@ def clients_edit(client_id):
     client.type = request.form.get('type', '').strip()
     client.address = request.form.get('address', '').strip()
     start_date_str = request.form.get('start_date', '').strip()
-    client.installation_fee = float(request.form.get('installation_fee', '0'))
-    client.monthly_payment = float(request.form.get('monthly_payment', '0'))
     client.status = request.form.get('status', 'active').strip()
     end_date_str = request.form.get('end_date', '').strip()
     
     try:
+        client.installation_fee = money.parse_amount(request.form.get('installation_fee'), default=0)
+        client.monthly_payment = money.parse_amount(request.form.get('monthly_payment'), default=0)
         if start_date_str:
             client.start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
         if end_date_str:
@@ -233,6 +306,7 @@ def clients_edit(client_id):
         else:
             client.end_date = None
         
+        client_cache.bump()
         db.session.commit()
         flash(f'Client {client.name} mis à jour', 'success')
     except ValueError as e:
@@ -244,38 +318,150 @@ def clients_edit(client_id):
 @app.route('/clients/delete/<int:client_id>', methods=['POST'])
 @login_required
 def clients_delete(client_id):
-    if session.get('username') != 'admin':
+    if not auth.is_admin():
         flash('Accès administrateur requis', 'danger')
         return redirect(url_for('index'))
     
     client = Client.query.get_or_404(client_id)
     client_name = client.name
+    # Its receipts are kept, as free-text receipts (SQLite does not enforce ON DELETE SET NULL)
+    Receipt.query.filter_by(client_id=client.id).update({'client_id': None}, synchronize_session=False)
     db.session.delete(client)
+    client_cache.bump()
     db.session.commit()
     flash(f'Client {client_name} supprimé', 'success')
     return redirect(url_for('clients'))
 
 
+@app.route('/billing/monthly', methods=['POST'])
+@login_required
+def billing_monthly():
+    """Create this month's recurring receipts for every active client in one batch."""
+    if not auth.is_admin():
+        flash('Accès administrateur requis', 'danger')
+        return redirect(url_for('index'))
+
+    month = request.form.get('month', '').strip() or datetime.now().strftime('%Y-%m')
+    try:
+        month_start = billing.parse_month(month)
+    except ValueError:
+        flash('Mois invalide (format attendu: AAAA-MM)', 'danger')
+        return redirect(url_for('clients'))
+
+    current_user = auth.current_user()
+    result = billing.run_monthly_billing(month_start, user_id=current_user.id if current_user else None)
+
+    # Render the new PDFs in the background so downloads are instant
+    if result['created']:
+        queue_receipt_pdfs(Receipt.query.filter(Receipt.id.in_(result['created'])).all())
+
+    flash(f"{len(result['created'])} reçus créés pour {month}, "
+          f"{len(result['skipped'])} clients déjà facturés", 'success')
+    return redirect(url_for('clients'))
+
+
+@app.route('/receivables')
+@login_required
+def receivables_report():
+    """Outstanding balances: expected monthly payments versus recurring receipts, per client."""
+    if not auth.is_admin():
+        flash('Accès administrateur requis', 'danger')
+        return redirect(url_for('index'))
+
+    try:
+        start, end = receivables.parse_period(request.args.get('start', '').strip(),
+                                              request.args.get('end', '').strip())
+    except ValueError:
+        flash(f'Période invalide (format attendu: AAAA-MM, {receivables.MAX_MONTHS} mois au plus)', 'danger')
+        start, end = receivables.default_period()
+    report = receivables.outstanding(start, end)
+    return render_template('receivables.html', report=report)
+
+
+@app.route('/api/receivables')
+@login_required
+def api_receivables():
+    """
+    Receivables of ?start=&end= (YYYY-MM, default the last 12 months) as
+    JSON, with the ?limit= largest balances (admin only). Revalidations
+    get a 304 while receipts and clients are unchanged.
+    """
+    if not auth.is_admin():
+        return {'error': 'Accès administrateur requis'}, 403
+    try:
+        start, end = receivables.parse_period(request.args.get('start', '').strip(),
+                                              request.args.get('end', '').strip())
+        limit = int(request.args.get('limit') or 0) or None
+    except ValueError:
+        return {'error': 'Paramètres invalides'}, 400
+
+    etag = receivables.etag(start, end, limit)
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        report = receivables.outstanding(start, end, limit=limit)
+        report.update(money.display(report, 'expected', 'received', 'outstanding'))
+        for item in report['items']:
+            item.update(money.display(item, 'monthly_payment', 'expected', 'received', 'outstanding'))
+        response = jsonify(report)
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+@app.route('/api/clients/search')
+@login_required
+def api_search_clients():
+    """Clients matching ?q= in name, type or address, for search-as-you-type fields."""
+    try:
+        limit = int(request.args.get('limit') or client_search.DEFAULT_LIMIT)
+    except ValueError:
+        return {'error': 'limit invalide'}, 400
+    items = client_cache.search(request.args.get('q', ''), limit=limit,
+                                status=request.args.get('status') or None)
+    return {'items': items}
+
+
+@app.route('/api/clients/revenue')
+@login_required
+def api_clients_revenue():
+    """Revenue summaries of the clients in ?ids=1,2,3 (admin only)."""
+    if not auth.is_admin():
+        return {'error': 'Accès administrateur requis'}, 403
+    try:
+        ids = [int(value) for value in request.args.get('ids', '').split(',') if value.strip()]
+    except ValueError:
+        return {'error': 'ids invalides'}, 400
+    summaries = client_revenue.summaries(ids[:client_search.MAX_LIMIT])
+    return {str(client_id): client_revenue.summary_to_dict(summary) for client_id, summary in summaries.items()}
+
+
 @app.route('/api/clients/<int:client_id>')
 @login_required
 def api_get_client(client_id):
     """API endpoint to get client details for auto-filling forms"""
-    client = Client.query.get_or_404(client_id)
-    return {
-        'id': client.id,
-        'name': client.name,
-        'type': client.type,
-        'address': client.address,
-        'monthly_payment': client.monthly_payment,
-        'installation_fee': client.installation_fee,
-        'status': client.status
-    }
+    entry = client_cache.get(client_id)
+    if entry is None:
+        return {'error': 'Client introuvable'}, 404
+    data, etag = entry
+
+    # Browsers revalidate with If-None-Match and get a 304 while the client is unchanged
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(data)
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
 
 
 @app.route('/account', methods=['GET', 'POST'])
 @login_required
 def account():
-    user = User.query.filter_by(username=session.get('username')).first()
+    current_user = auth.current_user()
+    user = db.session.get(User, current_user.id) if current_user else None
     if not user:
         flash('Utilisateur introuvable', 'danger')
         return redirect(url_for('logout'))
@@ -293,6 +479,7 @@ def account():
                 user.username = new_username
                 session['username'] = new_username
                 db.session.commit()
+                auth.invalidate(user.id)
                 flash('Nom d\'utilisateur mis à jour avec succès', 'success')
         
         elif action == 'update_password':
@@ -318,9 +505,8 @@ def account():
 @app.route('/')
 @login_required
 def index():
-    # Get all active clients for the dropdown
-    clients = Client.query.filter_by(status='active').order_by(Client.name).all()
-    return render_template('form.html', clients=clients)
+    # Clients are looked up through /api/clients/search as the user types
+    return render_template('form.html')
 
 @app.route('/generate', methods=['POST'])
 @login_required
@@ -336,15 +522,20 @@ def generate_receipt():
     else:
         description = payment_reason if payment_reason else 'Paiement unique'
     
-    price = float(request.form['price'])
+    price = money.parse_amount(request.form['price'])
     amount_in_letters = request.form.get('amount_in_letters', '').strip()
     date = datetime.now()
+
+    # Client picked in the form's client search, if any (it may have been deleted since)
+    client_id = request.form.get('client_select', type=int)
+    if client_id is not None and db.session.get(Client, client_id) is None:
+        client_id = None
     
-    # Generate receipt number (using timestamp for uniqueness)
-    receipt_number = f"REC-{int(datetime.now().timestamp())}"
+    # Allocate the next number of this year's series (see numbering.py)
+    receipt_number = numbering.next_number(date.year)
     
     # Get current user
-    current_user = User.query.filter_by(username=session.get('username')).first()
+    current_user = auth.current_user()
     
     # Save to database immediately
     new_receipt = Receipt(
@@ -356,9 +547,11 @@ def generate_receipt():
         price=price,
         amount_in_letters=amount_in_letters,
         date=date,
-        user_id=current_user.id if current_user else None
+        user_id=current_user.id if current_user else None,
+        client_id=client_id
     )
     db.session.add(new_receipt)
+    rollup.record_receipt(new_receipt)
     db.session.commit()
     
     flash('Reçu créé avec succès!', 'success')
@@ -374,13 +567,12 @@ def preview_receipt(receipt_id):
     return render_template('receipt_preview.html', receipt=receipt)
 
 
-@app.route('/receipt/download/<int:receipt_id>')
-@login_required
-def download_receipt(receipt_id):
-    receipt = Receipt.query.get_or_404(receipt_id)
-    
-    # Render HTML receipt
-    html = render_template('receipt_template.html', 
+def render_receipt_html(receipt, inline_stylesheet=False):
+    """
+    Render the HTML used to produce a receipt PDF. The PDF renderer applies
+    the stylesheet itself; HTML downloads need it inlined.
+    """
+    return render_template(pdf_renderer.TEMPLATE_NAME,
                          name=receipt.customer_name, 
                          description=receipt.description, 
                          price=receipt.price, 
@@ -388,39 +580,169 @@ def download_receipt(receipt_id):
                          payment_type=receipt.payment_type,
                          payment_reason=receipt.payment_reason,
                          date=receipt.date.strftime("%Y-%m-%d %H:%M:%S"),
-                         receipt_number=receipt.receipt_number)
+                         receipt_number=receipt.receipt_number,
+                         stylesheet_version=pdf_renderer.STYLESHEET_VERSION,
+                         inline_stylesheet=inline_stylesheet,
+                         stylesheet=pdf_renderer.STYLESHEET if inline_stylesheet else None)
+
+
+def receipt_pdf_job(receipt):
+    """Return the (job_id, source) of a receipt's PDF for the configured engine."""
+    if pdf_renderer.ENGINE == 'direct':
+        source = receipt_pdf.receipt_fields(receipt)
+    else:
+        source = render_receipt_html(receipt)
+    return pdf_renderer.job_id(source), source
+
+
+def queue_receipt_pdfs(receipts):
+    """
+    Submit background PDF renders for `receipts`.
 
-    # Save and generate PDF
-    if not os.path.exists('receipts'):
-        os.makedirs('receipts')
+    Stops early when the render queue is full; the remaining PDFs are then
+    rendered on their first download. Returns the queued job ids.
+    """
+    job_ids = []
+    for receipt in receipts:
+        job_id, source = receipt_pdf_job(receipt)
+        try:
+            render_queue.submit(source, job_id)
+        except render_queue.QueueFull:
+            break
+        job_ids.append(job_id)
+    return job_ids
+
+
+def wants_json():
+    """True when the client prefers a JSON response (fetch/XHR callers)."""
+    return request.accept_mimetypes['application/json'] > request.accept_mimetypes['text/html']
+
+
+@app.route('/receipt/download/<int:receipt_id>')
+@login_required
+def download_receipt(receipt_id):
+    receipt = Receipt.query.get_or_404(receipt_id)
 
     filename = f"receipt_{receipt.customer_name}_{receipt.receipt_number}.pdf"
     html_filename = f"receipt_{receipt.customer_name}_{receipt.receipt_number}.html"
-    pdf_path = os.path.join('receipts', filename)
-    html_path = os.path.join('receipts', html_filename)
-    
-    # Try to generate a PDF using WeasyPrint. If the native dependencies are
-    # missing (common on Windows), gracefully fall back to downloading HTML
-    try:
-        from weasyprint import HTML as WeasyHTML
-        WeasyHTML(string=html).write_pdf(pdf_path)
+
+    # Serve a previously rendered PDF when the receipt content is unchanged
+    job_id, source = receipt_pdf_job(receipt)
+    pdf_path = pdf_cache.lookup(job_id)
+    if pdf_path:
         return send_file(pdf_path, as_attachment=True, download_name=filename)
-    except Exception as e:
-        # Log to console for developer visibility and return HTML download as fallback
-        print("WeasyPrint PDF generation failed:", e)
+
+    # Render in the background process pool; the client polls the job status.
+    # With PDF_RENDER_WORKERS=0 or the direct engine the render has completed
+    # when submit returns.
+    try:
+        render_queue.submit(source, job_id)
+    except render_queue.QueueFull:
+        if wants_json():
+            return {'status': 'busy'}, 503, {'Retry-After': '5'}
+        flash('Le serveur génère déjà beaucoup de PDF, réessayez dans quelques secondes.', 'danger')
+        return redirect(url_for('preview_receipt', receipt_id=receipt.id))
+
+    state = render_queue.status(job_id)
+    if state == 'ready':
+        return send_file(pdf_cache.path_for(job_id), as_attachment=True, download_name=filename)
+
+    # If the PDF render failed for this receipt (native dependencies are often
+    # missing on Windows), gracefully fall back to downloading HTML. The
+    # failure is cleared so the next download retries the PDF.
+    if state == 'failed':
+        render_queue.clear_failure(job_id)
         print("Falling back to HTML download")
-        # Save HTML to file and send as download
+        if not os.path.exists('receipts'):
+            os.makedirs('receipts')
+        html_path = os.path.abspath(os.path.join('receipts', html_filename))
         with open(html_path, 'w', encoding='utf-8') as f:
-            f.write(html)
+            f.write(render_receipt_html(receipt, inline_stylesheet=True))
         return send_file(html_path, as_attachment=True, download_name=html_filename)
 
+    download_url = url_for('download_receipt', receipt_id=receipt.id)
+    status_url = url_for('receipt_job_status', job_id=job_id)
+    if wants_json():
+        return {'job_id': job_id, 'status': 'pending', 'status_url': status_url, 'download_url': download_url}, 202
+    return render_template('receipt_rendering.html', receipt=receipt, job_id=job_id,
+                           status_url=status_url, download_url=download_url), 202
+
+
+@app.route('/receipt/jobs/<job_id>')
+@login_required
+def receipt_job_status(job_id):
+    """Report the state of a background PDF render (see render_queue)."""
+    if not render_queue.is_valid_job_id(job_id):
+        return {'error': 'invalid job id'}, 404
+    return {'job_id': job_id, 'status': render_queue.status(job_id)}
+
+@app.route('/receipts/export.zip')
+@login_required
+def export_receipts_zip():
+    """Stream the PDFs of all receipts in a date range as a ZIP archive."""
+    try:
+        start, end = exports.parse_date_range(request.args)
+    except ValueError:
+        return {'error': 'Dates invalides (format attendu: AAAA-MM-JJ)'}, 400
+    if start is None or end is None:
+        return {'error': 'Les paramètres start et end sont requis'}, 400
+
+    # Admins may export any user's receipts (or everyone's); others only their own
+    current_user = auth.current_user()
+    if auth.is_admin():
+        user_id = request.args.get('user_id', type=int)
+    else:
+        user_id = current_user.id if current_user else None
+
+    receipts = exports.receipts_in_range(start, end, user_id=user_id)
+    archive = exports.stream_zip(exports.receipt_pdf_entries(receipts, receipt_pdf_job, render_receipt_html))
+    filename = f"recus_{request.args['start']}_{request.args['end']}.zip"
+    return Response(
+        stream_with_context(archive),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
+
+def _csv_export(model, columns, basename):
+    """Stream a CSV export scoped like the dashboard ('personal' or 'company')."""
+    try:
+        start, end = exports.parse_date_range(request.args)
+    except ValueError:
+        return {'error': 'Dates invalides (format attendu: AAAA-MM-JJ)'}, 400
+
+    view_mode = request.args.get('view', 'personal')
+    current_user = auth.current_user()
+    user_id = current_user.id if view_mode == 'personal' and current_user else None
+
+    rows = exports.stream_csv(model, columns, start=start, end=end, user_id=user_id)
+    filename = f"{basename}_{view_mode}_{datetime.now().strftime('%Y%m%d')}.csv"
+    return Response(
+        stream_with_context(rows),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
+
+@app.route('/export/receipts.csv')
+@login_required
+def export_receipts_csv():
+    return _csv_export(Receipt, exports.RECEIPT_CSV_COLUMNS, 'recus')
+
+
+@app.route('/export/expenses.csv')
+@login_required
+def export_expenses_csv():
+    return _csv_export(Expense, exports.EXPENSE_CSV_COLUMNS, 'depenses')
+
+
 @app.route('/expenses', methods=['GET', 'POST'])
 @login_required
 def add_expense():
     if request.method == 'POST':
         description = request.form['description']
-        amount = float(request.form['amount'])
-        current_user = User.query.filter_by(username=session.get('username')).first()
+        amount = money.parse_amount(request.form['amount'])
+        current_user = auth.current_user()
         new_expense = Expense(
             description=description, 
             amount=amount, 
@@ -428,26 +750,72 @@ def add_expense():
             user_id=current_user.id if current_user else None
         )
         db.session.add(new_expense)
+        rollup.record_expense(new_expense)
         db.session.commit()
         return redirect(url_for('dashboard'))
     return render_template('add_expense.html')
 
+def _run_import(dry_run):
+    """Import the uploaded CSV file (form field 'file') as ?kind= / form 'kind' rows of the current user."""
+    kind = request.values.get('kind', 'expenses')
+    upload = request.files.get('file')
+    if kind not in imports.KINDS:
+        raise ValueError(f'type inconnu: {kind!r}')
+    if upload is None or not upload.filename:
+        raise ValueError('fichier CSV requis')
+    # Uploads are spooled to a temporary file by Werkzeug and read as a stream
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+    return imports.import_csv(stream, kind, auth.current_user_id(), dry_run=dry_run)
+
+
+def _dry_run_requested():
+    return request.values.get('dry_run') in ('1', 'on', 'true')
+
+
+@app.route('/import', methods=['POST'])
+@login_required
+def import_file():
+    dry_run = _dry_run_requested()
+    try:
+        report = _run_import(dry_run)
+    except ValueError as e:
+        flash(f'Import impossible: {e}', 'danger')
+        return redirect(url_for('add_expense'))
+    imported = 'lignes valides' if dry_run else 'lignes importées'
+    flash(f"{report['imported']} {imported}, {report['duplicates']} doublons ignorés, "
+          f"{report['error_count']} erreurs", 'success' if not report['error_count'] else 'danger')
+    return render_template('add_expense.html', report=report)
+
+
+@app.route('/api/import', methods=['POST'])
+@login_required
+def api_import():
+    """Import a CSV file as JSON API: returns the import report (see imports.py)."""
+    try:
+        report = _run_import(_dry_run_requested())
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    return {**report, 'errors': [{'line': line, 'error': message} for line, message in report['errors']]}
+
+
 @app.route('/receipt/edit/<int:receipt_id>', methods=['GET', 'POST'])
 @login_required
 def edit_receipt(receipt_id):
     # Only admin can edit
-    if session.get('username') != 'admin':
+    if not auth.is_admin():
         flash('Accès administrateur requis', 'danger')
         return redirect(url_for('dashboard'))
     
     receipt = Receipt.query.get_or_404(receipt_id)
     
     if request.method == 'POST':
+        rollup.record_receipt(receipt, sign=-1)
         receipt.customer_name = request.form['name']
         receipt.description = request.form.get('description', '')
-        receipt.price = float(request.form['price'])
+        receipt.price = money.parse_amount(request.form['price'])
         receipt.amount_in_letters = request.form['amount_in_letters']
         receipt.date = datetime.strptime(request.form['date'], '%Y-%m-%d')
+        rollup.record_receipt(receipt)
         db.session.commit()
         flash('Reçu mis à jour avec succès', 'success')
         return redirect(url_for('dashboard'))
@@ -459,11 +827,12 @@ def edit_receipt(receipt_id):
 @login_required
 def delete_receipt(receipt_id):
     # Only admin can delete
-    if session.get('username') != 'admin':
+    if not auth.is_admin():
         flash('Accès administrateur requis', 'danger')
         return redirect(url_for('dashboard'))
     
     receipt = Receipt.query.get_or_404(receipt_id)
+    rollup.record_receipt(receipt, sign=-1)
     db.session.delete(receipt)
     db.session.commit()
     flash('Reçu supprimé avec succès', 'success')
@@ -474,16 +843,18 @@ def delete_receipt(receipt_id):
 @login_required
 def edit_expense(expense_id):
     # Only admin can edit
-    if session.get('username') != 'admin':
+    if not auth.is_admin():
         flash('Accès administrateur requis', 'danger')
         return redirect(url_for('dashboard'))
     
     expense = Expense.query.get_or_404(expense_id)
     
     if request.method == 'POST':
+        rollup.record_expense(expense, sign=-1)
         expense.description = request.form['description']
-        expense.amount = float(request.form['amount'])
+        expense.amount = money.parse_amount(request.form['amount'])
         expense.date = datetime.strptime(request.form['date'], '%Y-%m-%d')
+        rollup.record_expense(expense)
         db.session.commit()
         flash('Dépense mise à jour avec succès', 'success')
         return redirect(url_for('dashboard'))
@@ -495,22 +866,120 @@ def edit_expense(expense_id):
 @login_required
 def delete_expense(expense_id):
     # Only admin can delete
-    if session.get('username') != 'admin':
+    if not auth.is_admin():
         flash('Accès administrateur requis', 'danger')
         return redirect(url_for('dashboard'))
     
     expense = Expense.query.get_or_404(expense_id)
+    rollup.record_expense(expense, sign=-1)
     db.session.delete(expense)
     db.session.commit()
     flash('Dépense supprimée avec succès', 'success')
     return redirect(url_for('dashboard'))
 
 
+def _history_page(model):
+    """Fetch one keyset page of `model` for the history page/API query args."""
+    start, end = exports.parse_date_range(request.args)
+    view_mode = request.args.get('view', 'personal')
+    user_id = auth.current_user_id() if view_mode == 'personal' else None
+    if auth.is_admin() and request.args.get('user_id', type=int):
+        user_id = request.args.get('user_id', type=int)
+    rows, next_cursor = history.page(
+        model,
+        user_id=user_id,
+        start=start,
+        end=end,
+        cursor=request.args.get('cursor') or None,
+        limit=request.args.get('limit', type=int),
+    )
+    return rows, next_cursor, view_mode
+
+
+def _history_api(model, serialize):
+    try:
+        rows, next_cursor, _ = _history_page(model)
+    except ValueError as e:
+        return {'error': str(e)}, 400
+    return {'items': [serialize(row) for row in rows], 'next_cursor': next_cursor}
+
+
+def _history_view(model, kind):
+    try:
+        rows, next_cursor, view_mode = _history_page(model)
+    except ValueError:
+        flash('Paramètres de recherche invalides', 'danger')
+        return redirect(request.path)
+    args = {k: v for k, v in request.args.items() if k != 'cursor'}
+    return render_template('history.html', kind=kind, rows=rows, view_mode=view_mode,
+                           next_url=url_for(request.endpoint, **args, cursor=next_cursor) if next_cursor else None,
+                           first_url=url_for(request.endpoint, **args) if request.args.get('cursor') else None,
+                           filters=request.args)
+
+
+@app.route('/history/receipts')
+@login_required
+def receipts_history():
+    return _history_view(Receipt, 'receipts')
+
+
+@app.route('/history/expenses')
+@login_required
+def expenses_history():
+    return _history_view(Expense, 'expenses')
+
+
+@app.route('/api/history/receipts')
+@login_required
+def api_receipts_history():
+    return _history_api(Receipt, history.receipt_to_dict)
+
+
+@app.route('/api/history/expenses')
+@login_required
+def api_expenses_history():
+    return _history_api(Expense, history.expense_to_dict)
+
+
+def _search_page():
+    """Run the text search of the /search page/API query args."""
+    view_mode = request.args.get('view', 'personal')
+    user_id = auth.current_user_id() if view_mode == 'personal' else None
+    kind = request.args.get('kind', 'all')
+    kinds = text_search.KINDS if kind == 'all' else [kind]
+    page = max(1, request.args.get('page', 1, type=int))
+    results, has_next = text_search.search(request.args.get('q', ''), kinds=kinds, user_id=user_id, page=page,
+                                           per_page=request.args.get('per_page', type=int))
+    return results, has_next, page, view_mode
+
+
+@app.route('/search')
+@login_required
+def search():
+    results, has_next, page, view_mode = _search_page()
+    args = {k: v for k, v in request.args.items() if k != 'page'}
+    return render_template('search.html', results=results, view_mode=view_mode, filters=request.args,
+                           next_url=url_for('search', **args, page=page + 1) if has_next else None,
+                           previous_url=url_for('search', **args, page=page - 1) if page > 1 else None)
+
+
+@app.route('/api/search')
+@login_required
+def api_search():
+    """Receipts and expenses matching ?q=, best matches first (?kind=, ?view=, ?page=, ?per_page=)."""
+    results, has_next, page, _ = _search_page()
+    items = []
+    for kind, row in results:
+        item = history.receipt_to_dict(row) if kind == 'receipts' else history.expense_to_dict(row)
+        items.append({'kind': kind, **item})
+    return {'items': items, 'page': page, 'has_next': has_next}
+
+
 @app.route('/dashboard')
 @login_required
 def dashboard():
     # Get current user
-    current_user = User.query.filter_by(username=session.get('username')).first()
+    current_user = auth.current_user()
     
     # Check if user wants to see company-wide data (default to personal)
     view_mode = request.args.get('view', 'personal')  # 'personal' or 'company'
@@ -525,35 +994,7 @@ def dashboard():
         receipts_query = Receipt.query.filter_by(user_id=current_user.id if current_user else None)
         expenses_query = Expense.query.filter_by(user_id=current_user.id if current_user else None)
     
-    # Totals
-    total_income = db.session.query(func.sum(Receipt.price)).filter(
-        Receipt.user_id == current_user.id if view_mode == 'personal' and current_user else True
-    ).scalar() or 0
-    
-    total_expenses = db.session.query(func.sum(Expense.amount)).filter(
-        Expense.user_id == current_user.id if view_mode == 'personal' and current_user else True
-    ).scalar() or 0
-    
-    net_income = total_income - total_expenses
-
-    # Dialect-neutral monthly aggregation
-    receipts = receipts_query.with_entities(Receipt.date, Receipt.price).all()
-    expenses_rows = expenses_query.with_entities(Expense.date, Expense.amount).all()
-
-    income_by_month = {}
-    for dt, price in receipts:
-        key = dt.strftime('%Y-%m')
-        income_by_month[key] = income_by_month.get(key, 0) + float(price)
-
-    expenses_by_month = {}
-    for dt, amount in expenses_rows:
-        key = dt.strftime('%Y-%m')
-        expenses_by_month[key] = expenses_by_month.get(key, 0) + float(amount)
-
-    all_months = sorted(set(list(income_by_month.keys()) + list(expenses_by_month.keys())))
-    monthly_income_data = [(m, income_by_month.get(m, 0)) for m in all_months]
-    monthly_net_data = [(m, income_by_month.get(m, 0) - expenses_by_month.get(m, 0)) for m in all_months]
-    
+    # Totals and monthly series are loaded asynchronously from /api/dashboard
     # Recent receipts (don't show user info to maintain privacy)
     recent_receipts = receipts_query.order_by(Receipt.date.desc()).limit(10).all()
     
@@ -562,25 +1003,64 @@ def dashboard():
 
     return render_template(
         'dashboard.html',
-        total_income=total_income,
-        total_expenses=total_expenses,
-        net_income=net_income,
-        monthly_income_data=monthly_income_data,
-        monthly_net_data=monthly_net_data,
         recent_receipts=recent_receipts,
         recent_expenses=recent_expenses,
         view_mode=view_mode
     )
 
+@app.route('/api/dashboard')
+@login_required
+def api_dashboard():
+    """
+    Dashboard totals and monthly series as JSON.
+
+    Responses carry a strong ETag derived from the rollup data version, so
+    a revalidation with an unchanged version is answered with 304 without
+    computing the summary.
+    """
+    view_mode = request.args.get('view', 'personal')
+    user_id = auth.current_user_id() if view_mode == 'personal' else None
+    etag = reporting.dashboard_etag(user_id)
+
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        summary = reporting.monthly_summary(user_id)
+        response = jsonify(
+            view_mode=view_mode, **summary,
+            **money.display(summary, 'total_income', 'total_expenses', 'net_income'),
+            monthly_income_display=[money.format_money(income) for _, income in summary['monthly_income_data']],
+        )
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics; requires 'Authorization: Bearer <METRICS_TOKEN>', not served without the token."""
+    token = os.getenv('METRICS_TOKEN')
+    if not token:
+        # The app is exposed publicly through Caddy: no unauthenticated scrapes
+        return {'error': 'not found'}, 404
+    if not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return {'error': 'unauthorized'}, 401
+    return Response(instrumentation.metrics_text(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/healthz')
 def healthz():
     try:
         db_ok = db.session.execute(text('SELECT 1')).scalar() == 1
-        return {'status': 'ok', 'db': db_ok}, 200
+        return {'status': 'ok', 'db': db_ok, 'pdf_queue': render_queue.stats()}, 200
     except Exception as e:
         return {'status': 'error', 'error': str(e)}, 500
 
 if __name__ == '__main__':
     # Debug mode - only for local development
     # In production, use gunicorn instead (see Dockerfile)
+    import migrations
+    with app.app_context():
+        migrations.upgrade()
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,118 @@
+"""
+Current-user resolution for authenticated requests.
+
+The session stores the user id at login. current_user() resolves it once
+per request (memoized on flask.g) through a small process-local TTL cache
+of user records, so authenticated pages no longer pay a username lookup
+query each. The cache holds immutable snapshots (id, username,
+created_at), never ORM instances, and must be invalidated when a user is
+renamed or deleted. invalidate() only clears the worker that runs it:
+other gunicorn workers pick up a rename or deletion when their entry
+expires, so a deleted user's session stays valid in them for up to
+USER_CACHE_TTL seconds.
+
+Sessions are bound to the account's creation time as well as its id:
+SQLite reuses the id of a deleted user, and a session opened by the
+deleted user must not load the account that gets the id next. Such
+sessions are cleared.
+"""
+
+import os
+import threading
+import time
+from collections import namedtuple
+
+from flask import g, has_app_context, session
+
+from database import db, User
+
+CACHE_TTL = float(os.getenv('USER_CACHE_TTL') or 60)
+ADMIN_USERNAME = 'admin'
+
+CurrentUser = namedtuple('CurrentUser', ['id', 'username', 'created_at'])
+
+_lock = threading.Lock()
+_cache = {}
+
+
+def _load(user_id):
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(user_id)
+        if entry and entry[0] > now:
+            return entry[1]
+    user = db.session.get(User, user_id)
+    snapshot = CurrentUser(user.id, user.username, _created_token(user)) if user else None
+    with _lock:
+        _cache[user_id] = (now + CACHE_TTL, snapshot)
+    return snapshot
+
+
+def _created_token(user):
+    return user.created_at.isoformat() if user.created_at else ''
+
+
+def invalidate(user_id):
+    """Drop a user from this worker's cache (after a rename or deletion)."""
+    with _lock:
+        _cache.pop(user_id, None)
+    if has_app_context():
+        cached = g.get('current_user')
+        if cached is not None and cached.id == user_id:
+            g.pop('current_user')
+
+
+def login_user(user):
+    """Store the authenticated user in the session."""
+    session['logged_in'] = True
+    session['user_id'] = user.id
+    session['username'] = user.username
+    session['user_created'] = _created_token(user)
+    invalidate(user.id)
+
+
+def _session_matches(user):
+    token = session.get('user_created')
+    if token is None:
+        # Sessions opened before the creation time was stored at login
+        if session.get('username') != user.username:
+            return False
+        session['user_created'] = user.created_at
+        return True
+    if not token:
+        # Accounts without a creation time: fall back to the username
+        return session.get('username') == user.username
+    return token == user.created_at
+
+
+def current_user():
+    """Return the logged-in user as a CurrentUser snapshot, or None."""
+    if 'current_user' in g:
+        return g.current_user
+
+    user_id = session.get('user_id')
+    if user_id is None and session.get('username'):
+        # Sessions created before the user id was stored at login
+        user = User.query.filter_by(username=session['username']).first()
+        if user:
+            session['user_id'] = user_id = user.id
+
+    user = _load(user_id) if user_id is not None else None
+    if user and not _session_matches(user):
+        # The account was deleted and its id reused by another one
+        session.clear()
+        user = None
+    elif user and session.get('username') != user.username:
+        session['username'] = user.username
+    g.current_user = user
+    return user
+
+
+def current_user_id():
+    user = current_user()
+    return user.id if user else None
+
+
+def is_admin():
+    user = current_user()
+    return user is not None and user.username == ADMIN_USERNAME
@@ -0,0 +1,172 @@
+"""
+Bulk monthly billing for active clients.
+
+Creates one 'recurring_monthly' receipt per active client for a given
+month with a single batched INSERT, instead of one /generate form
+submission per client. Re-running a month skips clients that already
+have a recurring receipt in that month, so a run is idempotent.
+
+Used by the /billing/monthly admin endpoint and scripts/monthly_billing.py.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import and_, insert, or_
+
+from database import db, Receipt, Client
+import numbering
+import rollup
+
+RECURRING_DESCRIPTION = 'Paiement mensuel récurrent'
+
+_UNITS = ['zéro', 'un', 'deux', 'trois', 'quatre', 'cinq', 'six', 'sept', 'huit', 'neuf',
+          'dix', 'onze', 'douze', 'treize', 'quatorze', 'quinze', 'seize']
+_TENS = {2: 'vingt', 3: 'trente', 4: 'quarante', 5: 'cinquante', 6: 'soixante'}
+
+
+def _below_hundred(n):
+    if n <= 16:
+        return _UNITS[n]
+    if n < 20:
+        return 'dix-' + _UNITS[n - 10]
+    tens, unit = divmod(n, 10)
+    if tens in (7, 9):
+        # soixante-dix, quatre-vingt-dix: count from the previous ten
+        base = 'soixante' if tens == 7 else 'quatre-vingt'
+        rest = _below_hundred(10 + unit)
+        joiner = ' et ' if tens == 7 and unit == 1 else '-'
+        return base + joiner + rest
+    if tens == 8:
+        return 'quatre-vingts' if unit == 0 else 'quatre-vingt-' + _UNITS[unit]
+    word = _TENS[tens]
+    if unit == 0:
+        return word
+    if unit == 1:
+        return word + ' et un'
+    return word + '-' + _UNITS[unit]
+
+
+def _below_thousand(n, final=True):
+    hundreds, rest = divmod(n, 100)
+    parts = []
+    if hundreds:
+        if hundreds == 1:
+            parts.append('cent')
+        else:
+            # "deux cents" takes an s only when nothing follows
+            parts.append(_UNITS[hundreds] + (' cents' if rest == 0 and final else ' cent'))
+    if rest:
+        words = _below_hundred(rest)
+        if not final and words.endswith('quatre-vingts'):
+            words = words[:-1]  # "quatre-vingt mille"
+        parts.append(words)
+    return ' '.join(parts)
+
+
+def number_to_words(n):
+    """Spell a non-negative integer in French, e.g. 1250 -> 'mille deux cent cinquante'."""
+    n = int(n)
+    if n == 0:
+        return _UNITS[0]
+    parts = []
+    for value, singular, plural in ((10 ** 9, 'milliard', 'milliards'), (10 ** 6, 'million', 'millions')):
+        count, n = divmod(n, value)
+        if count:
+            parts.append(f"{number_to_words(count)} {singular if count == 1 else plural}")
+    thousands, n = divmod(n, 1000)
+    if thousands:
+        parts.append('mille' if thousands == 1 else _below_thousand(thousands, final=False) + ' mille')
+    if n:
+        parts.append(_below_thousand(n))
+    return ' '.join(parts)
+
+
+def amount_in_letters(amount):
+    """Return the receipt 'Montant en Lettres' text for an amount in FCFA."""
+    words = number_to_words(round(amount))
+    return f"{words[0].upper()}{words[1:]} francs CFA"
+
+
+def parse_month(value):
+    """Parse 'YYYY-MM' into the first day of that month (datetime)."""
+    return datetime.strptime(value, '%Y-%m')
+
+
+def month_bounds(month_start):
+    """Return [start, end) datetimes of the month starting at `month_start`."""
+    if month_start.month == 12:
+        return month_start, month_start.replace(year=month_start.year + 1, month=1)
+    return month_start, month_start.replace(month=month_start.month + 1)
+
+
+def billable_clients(month_start):
+    """Active clients whose end date has not passed before `month_start`."""
+    return (
+        Client.query
+        .filter(Client.status == 'active')
+        .filter(or_(Client.end_date.is_(None), Client.end_date >= month_start.date()))
+        .filter(Client.monthly_payment > 0)
+        .order_by(Client.name)
+        .all()
+    )
+
+
+def run_monthly_billing(month_start, user_id=None, now=None):
+    """
+    Create the recurring receipts of `month_start`'s month for all billable clients.
+
+    Returns a dict with the new receipt ids ('created') and the names of the
+    clients skipped because they were already billed that month ('skipped').
+    """
+    now = now or datetime.now()
+    start, end = month_bounds(month_start)
+    receipt_date = now if start <= now < end else start
+
+    clients = billable_clients(start)
+    billed_ids, billed_names = set(), set()
+    if clients:
+        # Receipts created before client_id existed are matched by name
+        billed = (
+            db.session.query(Receipt.client_id, Receipt.customer_name)
+            .filter(Receipt.payment_type == 'recurring_monthly')
+            .filter(Receipt.date >= start, Receipt.date < end)
+            .filter(or_(Receipt.client_id.in_([c.id for c in clients]),
+                        and_(Receipt.client_id.is_(None), Receipt.customer_name.in_([c.name for c in clients]))))
+        )
+        for client_id, name in billed:
+            if client_id is None:
+                billed_names.add(name)
+            else:
+                billed_ids.add(client_id)
+
+    to_bill = []
+    skipped = []
+    for client in clients:
+        if client.id in billed_ids or client.name in billed_names:
+            skipped.append(client.name)
+            continue
+        to_bill.append(client)
+
+    # Reserve all receipt numbers of the run in one block
+    numbers = numbering.allocate(len(to_bill), receipt_date.year) if to_bill else []
+    rows = []
+    for client, receipt_number in zip(to_bill, numbers):
+        rows.append({
+            'receipt_number': receipt_number,
+            'customer_name': client.name,
+            'client_id': client.id,
+            'description': RECURRING_DESCRIPTION,
+            'payment_type': 'recurring_monthly',
+            'payment_reason': '',
+            'price': client.monthly_payment,
+            'amount_in_letters': amount_in_letters(client.monthly_payment),
+            'date': receipt_date,
+            'user_id': user_id,
+        })
+
+    created = []
+    if rows:
+        created = list(db.session.scalars(insert(Receipt).returning(Receipt.id), rows))
+        rollup.apply_delta(user_id, rollup.month_key(receipt_date), income=sum(r['price'] for r in rows))
+    db.session.commit()
+    return {'created': created, 'skipped': skipped}
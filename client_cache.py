@@ -0,0 +1,100 @@
+"""
+Process-local cache of client reference data.
+
+Client records and client search results are cached in each gunicorn
+worker's memory. Coherence across workers relies on the 'clients' counter
+of the cache_version table: every client write calls bump() in its
+transaction, and a worker drops its cached entries when it sees a
+different version. The version is read at most once per
+CLIENT_CACHE_CHECK_INTERVAL seconds, so other workers may serve entries
+that are stale by up to that long. The worker that made the change sees
+it immediately.
+
+Cached values are plain dicts (client_search.client_to_dict), never ORM
+instances.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from sqlalchemy import select, update
+
+import client_search
+from database import db, CacheVersion, Client
+
+CHECK_INTERVAL = float(os.getenv('CLIENT_CACHE_CHECK_INTERVAL') or 2)
+MAX_ENTRIES = 2000
+VERSION_NAME = 'clients'
+
+_lock = threading.Lock()
+_clients = {}
+_searches = {}
+_version = None
+_checked_at = 0.0
+
+
+def bump():
+    """Record a client change in the current transaction (the caller commits)."""
+    global _checked_at
+    updated = db.session.execute(
+        update(CacheVersion)
+        .where(CacheVersion.name == VERSION_NAME)
+        .values(version=CacheVersion.version + 1)
+    ).rowcount
+    if not updated:
+        db.session.add(CacheVersion(name=VERSION_NAME, version=1))
+    with _lock:
+        _clients.clear()
+        _searches.clear()
+        # Re-read the version on next access, once the caller has committed
+        _checked_at = 0.0
+
+
+def _sync():
+    global _version, _checked_at
+    now = time.monotonic()
+    if now - _checked_at < CHECK_INTERVAL:
+        return
+    version = db.session.scalar(select(CacheVersion.version).where(CacheVersion.name == VERSION_NAME))
+    with _lock:
+        if version != _version:
+            _clients.clear()
+            _searches.clear()
+            _version = version
+        _checked_at = now
+
+
+def _store(cache, key, value):
+    with _lock:
+        if len(cache) >= MAX_ENTRIES:
+            cache.clear()
+        cache[key] = value
+
+
+def get(client_id):
+    """Return (client dict, etag) for a client, or None if it does not exist."""
+    _sync()
+    entry = _clients.get(client_id)
+    if entry is None:
+        client = db.session.get(Client, client_id)
+        if client is None:
+            return None
+        data = client_search.client_to_dict(client)
+        etag = hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+        entry = (data, etag)
+        _store(_clients, client_id, entry)
+    return entry
+
+
+def search(q, limit=client_search.DEFAULT_LIMIT, status=None):
+    """Cached client_search.search(), returned as a list of client dicts."""
+    _sync()
+    key = (' '.join((q or '').split()).lower(), limit, status)
+    items = _searches.get(key)
+    if items is None:
+        items = [client_search.client_to_dict(client) for client in client_search.search(q, limit, status)]
+        _store(_searches, key, items)
+    return items
@@ -0,0 +1,93 @@
+"""
+Revenue per client, from the receipts linked to it by Receipt.client_id.
+
+Receipts get a client_id when the receipt form was filled from a client
+and when monthly billing creates them. backfill() links older receipts
+whose customer name matches exactly one client (ignoring case and
+surrounding spaces); ambiguous names are left unlinked.
+
+Every query groups receipts of the requested clients only, through the
+ix_receipt_client_date (client_id, date) index.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import exists, func, select, update
+
+import money
+from database import db, Receipt, Client
+from reporting import amount_sum, month_bucket
+
+
+def _name_key(column):
+    return func.lower(func.trim(column))
+
+
+def backfill():
+    """Link unlinked receipts to the client of the same name. Returns the number of receipts linked."""
+    key = _name_key(Client.name).label('key')
+    unique_names = (
+        select(key, func.min(Client.id).label('id'))
+        .group_by(key)
+        .having(func.count(Client.id) == 1)
+        .subquery()
+    )
+    match = unique_names.c.key == _name_key(Receipt.customer_name)
+    result = db.session.execute(
+        update(Receipt)
+        .where(Receipt.client_id.is_(None), exists().where(match))
+        .values(client_id=select(unique_names.c.id).where(match).scalar_subquery())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def summaries(client_ids):
+    """
+    Return {client_id: {'total', 'receipts', 'last_payment'}} for `client_ids`.
+
+    Clients without receipts are included with a zero total.
+    """
+    client_ids = list(client_ids)
+    result = {client_id: {'total': 0, 'receipts': 0, 'last_payment': None} for client_id in client_ids}
+    if not client_ids:
+        return result
+    query = (
+        select(Receipt.client_id, amount_sum(Receipt.price), func.count(Receipt.id), func.max(Receipt.date))
+        .where(Receipt.client_id.in_(client_ids))
+        .group_by(Receipt.client_id)
+    )
+    for client_id, total, count, last_payment in db.session.execute(query):
+        result[client_id] = {'total': total or 0, 'receipts': count, 'last_payment': last_payment}
+    return result
+
+
+def _month_starts(months, now):
+    year, month = now.year, now.month
+    starts = []
+    for _ in range(months):
+        starts.append(datetime(year, month, 1))
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return starts[::-1]
+
+
+def monthly(client_id, months=12, now=None):
+    """Return [(month 'YYYY-MM', total)] of a client's last `months` months, oldest first."""
+    starts = _month_starts(months, now or datetime.now())
+    bucket = month_bucket(Receipt.date)
+    query = (
+        select(bucket, amount_sum(Receipt.price))
+        .where(Receipt.client_id == client_id, Receipt.date >= starts[0])
+        .group_by(bucket)
+    )
+    totals = dict(db.session.execute(query).all())
+    return [(start.strftime('%Y-%m'), totals.get(start.strftime('%Y-%m'), 0)) for start in starts]
+
+
+def summary_to_dict(summary):
+    return {
+        'total': summary['total'],
+        'total_display': money.format_money(summary['total']),
+        'receipts': summary['receipts'],
+        'last_payment': summary['last_payment'].isoformat() if summary['last_payment'] else None,
+    }
@@ -0,0 +1,140 @@
+"""
+Indexed client search for the receipt form and client management page.
+
+Matching ignores case and accents ("eloi" finds "Éloïse"): queries are
+compared with Client.search_key (name, type and address) and
+Client.name_key (name), which hold the text folded by database.fold() and
+are set on every insert and update of a client. SQLite's lower() and
+LIKE only fold ASCII, so the raw columns are not matched.
+
+Queries of at least MIN_SUBSTRING_LENGTH characters match anywhere in the
+search key:
+- PostgreSQL: LIKE on search_key, served by a pg_trgm GIN index
+- SQLite: an FTS5 trigram table (client_fts) kept in sync by triggers
+
+Shorter queries match the start of the name only. Results list clients
+whose name starts with the query first, then the others by name.
+ensure_index() creates the index objects; it is idempotent.
+"""
+
+from sqlalchemy import case, literal_column, select, table, text
+from sqlalchemy.exc import DBAPIError
+
+import money
+from database import db, Client, fold
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+MIN_SUBSTRING_LENGTH = 3
+
+_POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_client_search_key_trgm ON client USING gin (search_key gin_trgm_ops)",
+]
+
+_SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS client_fts USING fts5("
+    "search_key, content='client', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS client_fts_ai AFTER INSERT ON client BEGIN "
+    "INSERT INTO client_fts(rowid, search_key) VALUES (new.id, new.search_key); END",
+    "CREATE TRIGGER IF NOT EXISTS client_fts_ad AFTER DELETE ON client BEGIN "
+    "INSERT INTO client_fts(client_fts, rowid, search_key) VALUES ('delete', old.id, old.search_key); END",
+    "CREATE TRIGGER IF NOT EXISTS client_fts_au AFTER UPDATE ON client BEGIN "
+    "INSERT INTO client_fts(client_fts, rowid, search_key) VALUES ('delete', old.id, old.search_key); "
+    "INSERT INTO client_fts(rowid, search_key) VALUES (new.id, new.search_key); END",
+]
+
+# Index objects of the first version, which matched the raw name, type and address
+_OLD_POSTGRES_DDL = ["DROP INDEX IF EXISTS ix_client_search_trgm"]
+_OLD_SQLITE_DDL = [
+    "DROP TRIGGER IF EXISTS client_fts_ai",
+    "DROP TRIGGER IF EXISTS client_fts_ad",
+    "DROP TRIGGER IF EXISTS client_fts_au",
+    "DROP TABLE IF EXISTS client_fts",
+]
+
+_client_fts = table('client_fts')
+_has_fts = None
+
+
+def ensure_index(replace=False):
+    """
+    Create the search index (and on SQLite populate it). With `replace`,
+    drop the index objects first. Returns False if unsupported.
+    """
+    global _has_fts
+    engine = db.engine
+    try:
+        with engine.begin() as conn:
+            if replace:
+                old_ddl = _OLD_POSTGRES_DDL if engine.dialect.name == 'postgresql' else _OLD_SQLITE_DDL
+                for statement in old_ddl:
+                    conn.execute(text(statement))
+            if engine.dialect.name == 'postgresql':
+                for statement in _POSTGRES_DDL:
+                    conn.execute(text(statement))
+                return True
+            exists = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'client_fts'")).first()
+            for statement in _SQLITE_DDL:
+                conn.execute(text(statement))
+            if not exists:
+                conn.execute(text("INSERT INTO client_fts(client_fts) VALUES ('rebuild')"))
+        _has_fts = True
+    except DBAPIError:
+        # No pg_trgm privileges or an SQLite build without the trigram tokenizer:
+        # search still works, through sequential scans
+        _has_fts = False
+    return bool(_has_fts)
+
+
+def _fts_available():
+    global _has_fts
+    if _has_fts is None:
+        _has_fts = db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'client_fts'")).first() is not None
+    return _has_fts
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search(q, limit=DEFAULT_LIMIT, status=None):
+    """Return up to `limit` clients matching `q`, optionally restricted to a status."""
+    q = fold(q)
+    limit = max(1, min(int(limit or DEFAULT_LIMIT), MAX_LIMIT))
+    name_prefix = Client.name_key.like(_escape_like(q) + '%', escape='\\')
+
+    query = Client.query
+    if status:
+        query = query.filter(Client.status == status)
+    if len(q) < MIN_SUBSTRING_LENGTH:
+        query = query.filter(name_prefix)
+    elif db.engine.dialect.name == 'sqlite' and _fts_available():
+        phrase = '"' + q.replace('"', '""') + '"'
+        matches = select(literal_column('rowid')).select_from(_client_fts).where(
+            text('client_fts MATCH :phrase').bindparams(phrase=phrase))
+        query = query.filter(Client.id.in_(matches))
+    else:
+        query = query.filter(Client.search_key.like('%' + _escape_like(q) + '%', escape='\\'))
+
+    return (
+        query.order_by(case((name_prefix, 0), else_=1), Client.name, Client.id)
+        .limit(limit)
+        .all()
+    )
+
+
+def client_to_dict(client):
+    return {
+        'id': client.id,
+        'name': client.name,
+        'type': client.type,
+        'address': client.address,
+        'start_date': client.start_date.isoformat() if client.start_date else None,
+        'monthly_payment': client.monthly_payment,
+        'monthly_payment_display': money.format_money(client.monthly_payment),
+        'installation_fee': client.installation_fee,
+        'status': client.status,
+    }
@@ -5,9 +5,17 @@ This module defines SQLAlchemy models for:
 - Users: Authentication and user management
 - Receipts: Generated PDF receipts with automatic numbering
 - Expenses: Expense tracking with user association
+- Clients: Client records used to pre-fill receipts
+- MonthlyRollup: Per-user monthly income/expense sums for the dashboard
+- ReceiptSequence: Receipt number counters (SQLite; PostgreSQL uses sequences)
+- CacheVersion: Invalidation counters of per-worker caches
+- SchemaMigration: Applied schema migrations (see migrations.py)
 """
 
+import unicodedata
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 from datetime import datetime
 
 db = SQLAlchemy()
@@ -36,16 +44,25 @@ class Receipt(db.Model):
     Each receipt has a unique number and is associated with the user who created it.
     Supports recurring monthly payments and one-time payments with custom reasons.
     """
+    __table_args__ = (
+        # Keyset pagination of a user's history on (date, id)
+        db.Index('ix_receipt_user_date', 'user_id', 'date'),
+        # Per-client revenue (see client_revenue.py)
+        db.Index('ix_receipt_client_date', 'client_id', 'date'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     receipt_number = db.Column(db.String(50), unique=True, nullable=False, index=True)
     customer_name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.String(200), nullable=False)
     payment_type = db.Column(db.String(50), nullable=False)  # 'recurring_monthly' or 'one_time'
     payment_reason = db.Column(db.String(200))  # Optional, for one-time payments
-    price = db.Column(db.Float, nullable=False)
+    price = db.Column(db.BigInteger, nullable=False)  # whole francs CFA (see money.py)
     amount_in_letters = db.Column(db.String(200), nullable=False)
     date = db.Column(db.DateTime, default=datetime.now, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
+    # The client picked on the receipt form (NULL for free-text customers)
+    client_id = db.Column(db.Integer, db.ForeignKey('client.id', ondelete='SET NULL'), nullable=True)
     
     user = db.relationship('User', backref='receipts')
     
@@ -60,9 +77,14 @@ class Expense(db.Model):
     Each expense is associated with the user who created it.
     Used for calculating net income in the dashboard.
     """
+    __table_args__ = (
+        # Keyset pagination of a user's history on (date, id)
+        db.Index('ix_expense_user_date', 'user_id', 'date'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     description = db.Column(db.String(200), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    amount = db.Column(db.BigInteger, nullable=False)  # whole francs CFA
     date = db.Column(db.DateTime, default=datetime.now, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
     
@@ -83,11 +105,100 @@ class Client(db.Model):
     type = db.Column(db.String(100))  # e.g., "Cabinet dentaire", "Cabinet médical"
     address = db.Column(db.String(500))
     start_date = db.Column(db.Date, nullable=False)
-    installation_fee = db.Column(db.Float, default=0.0)
-    monthly_payment = db.Column(db.Float, default=0.0)
+    installation_fee = db.Column(db.BigInteger, default=0)  # whole francs CFA
+    monthly_payment = db.Column(db.BigInteger, default=0)
     status = db.Column(db.String(50), default='active')  # e.g., "active", "stopped", "pending"
     end_date = db.Column(db.Date, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.now)
+    # Unaccented lowercase name, and name, type and address, for client_search
+    name_key = db.Column(db.String(200), index=True)
+    search_key = db.Column(db.String(802))
     
     def __repr__(self):
         return f'<Client {self.name}>'
+
+
+def fold(text):
+    """Lowercase `text` without accents and with single spaces ('Éloïse ' -> 'eloise')."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ' '.join(''.join(char for char in decomposed if not unicodedata.combining(char)).casefold().split())
+
+
+def client_search_keys(name, type_, address):
+    """(name_key, search_key) of a client."""
+    return fold(name), ' '.join(part for part in (fold(name), fold(type_), fold(address)) if part)
+
+
+@event.listens_for(Client, 'before_insert')
+@event.listens_for(Client, 'before_update')
+def _set_client_search_keys(mapper, connection, client):
+    client.name_key, client.search_key = client_search_keys(client.name, client.type, client.address)
+
+
+class MonthlyRollup(db.Model):
+    """
+    Pre-aggregated income and expense sums per user and month.
+
+    Maintained in the same transaction as every receipt/expense write so the
+    dashboard reads O(months) rows. Rows with user_id NULL hold data that is
+    not associated with any user. Use scripts/rollup.py to rebuild or verify.
+    """
+    __tablename__ = 'monthly_rollup'
+    __table_args__ = (db.UniqueConstraint('user_id', 'month', name='uq_monthly_rollup_user_month'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
+    month = db.Column(db.String(7), nullable=False, index=True)  # 'YYYY-MM'
+    income = db.Column(db.BigInteger, nullable=False, default=0)
+    expenses = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    def __repr__(self):
+        return f'<MonthlyRollup {self.user_id} {self.month}: +{self.income} -{self.expenses}>'
+
+
+class ReceiptSequence(db.Model):
+    """
+    Per-year receipt number counter used on SQLite.
+
+    PostgreSQL uses native sequences (receipt_number_seq_<year>) instead;
+    see numbering.py.
+    """
+    __tablename__ = 'receipt_sequence'
+
+    year = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    next_value = db.Column(db.Integer, nullable=False, default=1)
+
+    def __repr__(self):
+        return f'<ReceiptSequence {self.year}: {self.next_value}>'
+
+
+class CacheVersion(db.Model):
+    """
+    Version counters of data cached in each worker's memory.
+
+    Writers bump the counter of what they change in the same transaction;
+    workers compare it with the version of their cached copy. See
+    client_cache.py.
+    """
+    __tablename__ = 'cache_version'
+
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+
+    def __repr__(self):
+        return f'<CacheVersion {self.name}: {self.version}>'
+
+
+class SchemaMigration(db.Model):
+    """
+    One row per migration of migrations.py applied to this database.
+    """
+    __tablename__ = 'schema_migrations'
+
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(100), nullable=False)
+    applied_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    def __repr__(self):
+        return f'<SchemaMigration {self.version}: {self.name}>'
@@ -0,0 +1,211 @@
+"""
+Streaming exports of receipts and expenses (PDF archives and CSV files).
+
+Exports are generators meant to be wrapped in a streamed Flask Response:
+bytes are sent as soon as they are produced, and neither the archive nor
+the query result is ever held in full in memory or on disk.
+"""
+
+import csv
+import io
+import re
+import zipfile
+from datetime import datetime, timedelta
+
+import pdf_cache
+import render_queue
+from sqlalchemy import select
+
+from database import db, Receipt, Expense, User
+
+ZIP_CHUNK_SIZE = 64 * 1024
+CSV_BATCH_SIZE = 1000
+
+RECEIPT_CSV_COLUMNS = [
+    ('receipt_number', Receipt.receipt_number),
+    ('date', Receipt.date),
+    ('customer_name', Receipt.customer_name),
+    ('description', Receipt.description),
+    ('payment_type', Receipt.payment_type),
+    ('payment_reason', Receipt.payment_reason),
+    ('price', Receipt.price),
+    ('amount_in_letters', Receipt.amount_in_letters),
+    ('username', User.username),
+]
+
+EXPENSE_CSV_COLUMNS = [
+    ('id', Expense.id),
+    ('date', Expense.date),
+    ('description', Expense.description),
+    ('amount', Expense.amount),
+    ('username', User.username),
+]
+
+
+class _ChunkSink:
+    """Write-only, unseekable file object that buffers bytes until drained."""
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def parse_date_range(args):
+    """
+    Parse 'start' and 'end' (YYYY-MM-DD, both inclusive) from request args.
+
+    Returns (start, end) datetimes with `end` exclusive; either may be None
+    when absent. Raises ValueError on malformed dates.
+    """
+    start = args.get('start', '').strip()
+    end = args.get('end', '').strip()
+    start_dt = datetime.strptime(start, '%Y-%m-%d') if start else None
+    end_dt = datetime.strptime(end, '%Y-%m-%d') + timedelta(days=1) if end else None
+    return start_dt, end_dt
+
+
+def filter_by_date(query, model, start, end):
+    if start is not None:
+        query = query.filter(model.date >= start)
+    if end is not None:
+        query = query.filter(model.date < end)
+    return query
+
+
+def stream_zip(entries):
+    """
+    Yield a ZIP archive built from (arcname, path_or_bytes) entries.
+
+    Each entry is written as soon as it is pulled from `entries`, using data
+    descriptors so the output never needs to be seeked. PDFs are already
+    compressed, so entries are stored rather than deflated.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for arcname, content in entries:
+            if isinstance(content, bytes):
+                archive.writestr(arcname, content)
+            else:
+                info = zipfile.ZipInfo.from_file(content, arcname)
+                with open(content, 'rb') as src, archive.open(info, 'w') as dst:
+                    while True:
+                        chunk = src.read(ZIP_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        dst.write(chunk)
+                        yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
+
+
+def _archive_name(receipt, extension):
+    name = re.sub(r'[\\/:*?"<>|]+', '_', f"receipt_{receipt.customer_name}_{receipt.receipt_number}")
+    return f"{name}.{extension}"
+
+
+def receipt_pdf_entries(receipts, pdf_job, render_html, window=None):
+    """
+    Yield (arcname, path_or_bytes) entries for receipts, rendering on demand.
+
+    pdf_job(receipt) returns the (job_id, source) of the receipt's PDF and
+    render_html(receipt, inline_stylesheet=True) its HTML fallback.
+
+    Receipts are processed in windows: the PDFs of a whole window are
+    submitted to the background render pool (cached ones are reused), then
+    yielded in order as they become ready. Receipts whose PDF cannot be
+    rendered are exported as HTML, like download_receipt() does.
+    """
+    window = window or max(1, render_queue.MAX_QUEUE // 2)
+    batch = []
+    for receipt in receipts:
+        batch.append(receipt)
+        if len(batch) >= window:
+            yield from _render_window(batch, pdf_job, render_html)
+            batch = []
+    if batch:
+        yield from _render_window(batch, pdf_job, render_html)
+
+
+def _render_window(receipts, pdf_job, render_html):
+    jobs = []
+    for receipt in receipts:
+        job_id, source = pdf_job(receipt)
+        if not pdf_cache.lookup(job_id):
+            try:
+                render_queue.submit(source, job_id)
+            except render_queue.QueueFull:
+                # The pool is saturated by other requests: render here instead
+                render_queue.render_now(source, job_id)
+        jobs.append((receipt, job_id))
+
+    for receipt, job_id in jobs:
+        if render_queue.wait(job_id) == 'ready':
+            yield _archive_name(receipt, 'pdf'), pdf_cache.path_for(job_id)
+        else:
+            render_queue.clear_failure(job_id)
+            yield _archive_name(receipt, 'html'), render_html(receipt, inline_stylesheet=True).encode('utf-8')
+
+
+def receipts_in_range(start, end, user_id=None, batch_size=200):
+    """Receipts in [start, end) in date order, fetched in batches (uses the date index)."""
+    query = filter_by_date(Receipt.query, Receipt, start, end)
+    if user_id is not None:
+        query = query.filter(Receipt.user_id == user_id)
+    return query.order_by(Receipt.date, Receipt.id).yield_per(batch_size)
+
+
+def _drain(buffer):
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+def stream_csv(model, columns, start=None, end=None, user_id=None, batch_size=CSV_BATCH_SIZE):
+    """
+    Yield a CSV export of `model` rows in date order, one chunk per batch.
+
+    Rows are read through a server-side cursor (stream_results/yield_per on
+    PostgreSQL) so memory stays constant regardless of the export size, and
+    the header is sent before the query even runs.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in columns])
+    # UTF-8 BOM so that spreadsheet software detects the encoding of French text
+    yield '\ufeff' + _drain(buffer)
+
+    query = select(*[column for _, column in columns]).outerjoin(User, model.user_id == User.id)
+    if start is not None:
+        query = query.where(model.date >= start)
+    if end is not None:
+        query = query.where(model.date < end)
+    if user_id is not None:
+        query = query.where(model.user_id == user_id)
+    query = query.order_by(model.date, model.id).execution_options(stream_results=True, yield_per=batch_size)
+
+    result = db.session.execute(query)
+    try:
+        for rows in result.partitions():
+            for row in rows:
+                writer.writerow([value.isoformat(sep=' ') if isinstance(value, datetime) else value
+                                 for value in row])
+            yield _drain(buffer)
+    finally:
+        result.close()
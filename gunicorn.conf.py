@@ -0,0 +1,19 @@
+"""
+gunicorn settings (read automatically from the working directory).
+
+Each worker prepares the PDF renderer as soon as it has loaded the app, so
+the first receipt download costs the same as the following ones (see
+pdf_renderer.py).
+"""
+
+import os
+
+bind = os.getenv('GUNICORN_BIND') or '0.0.0.0:8000'
+workers = int(os.getenv('GUNICORN_WORKERS') or 2)
+
+
+def post_worker_init(worker):
+    import render_queue
+    from app import app
+
+    render_queue.start(app)
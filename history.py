@@ -0,0 +1,87 @@
+"""
+Keyset-paginated receipt and expense history.
+
+Pages are ordered by (date, id) descending and continue from an opaque
+cursor holding the (date, id) of the last row shown, instead of using
+OFFSET. Each page is an index range scan on (user_id, date) or (date), so
+page N costs the same as page 1 however deep the history is.
+"""
+
+import base64
+from datetime import datetime
+
+from sqlalchemy import and_, tuple_
+from sqlalchemy.orm import joinedload
+
+from exports import filter_by_date
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(row):
+    raw = f"{row.date.isoformat()}|{row.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return the (date, id) encoded in `cursor`; raises ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        date_part, id_part = raw.rsplit('|', 1)
+        return datetime.fromisoformat(date_part), int(id_part)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"invalid cursor: {cursor!r}") from e
+
+
+def page(model, user_id=None, start=None, end=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Return (rows, next_cursor) for one history page of `model` (Receipt or Expense).
+
+    `user_id` restricts the page to one user (None for everyone), `start`
+    and `end` bound the date range ([start, end)), and `cursor` is the
+    next_cursor of the previous page. next_cursor is None on the last page.
+    """
+    limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+    query = filter_by_date(model.query.filter(model.date.isnot(None)), model, start, end)
+    if user_id is not None:
+        query = query.filter(model.user_id == user_id)
+    if cursor:
+        cursor_date, cursor_id = decode_cursor(cursor)
+        # The plain date bound lets the planner turn the row comparison into an index range
+        query = query.filter(and_(
+            model.date <= cursor_date,
+            tuple_(model.date, model.id) < tuple_(cursor_date, cursor_id),
+        ))
+    rows = (
+        query.options(joinedload(model.user))
+        .order_by(model.date.desc(), model.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def receipt_to_dict(receipt):
+    return {
+        'id': receipt.id,
+        'receipt_number': receipt.receipt_number,
+        'customer_name': receipt.customer_name,
+        'description': receipt.description,
+        'payment_type': receipt.payment_type,
+        'payment_reason': receipt.payment_reason,
+        'price': receipt.price,
+        'date': receipt.date.isoformat() if receipt.date else None,
+        'username': receipt.user.username if receipt.user else None,
+    }
+
+
+def expense_to_dict(expense):
+    return {
+        'id': expense.id,
+        'description': expense.description,
+        'amount': expense.amount,
+        'date': expense.date.isoformat() if expense.date else None,
+        'username': expense.user.username if expense.user else None,
+    }
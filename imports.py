@@ -0,0 +1,312 @@
+"""
+Streaming CSV import of expenses and receipts.
+
+Files are read row by row with csv.DictReader and written in batches of
+BATCH_SIZE rows, one transaction per batch (a single executemany INSERT,
+the rollup deltas of the batch and, for receipts, one block of receipt
+numbers per year). Memory depends on the batch size, not on the file.
+
+Columns are those of the CSV exports (exports.py), so an export can be
+imported back; unknown columns such as id and username are ignored:
+- expenses: date, description, amount
+- receipts: date, customer_name, price, and optionally receipt_number,
+  description, payment_type (recurring_monthly or one_time, default
+  one_time), payment_reason, amount_in_letters
+Dates are 'YYYY-MM-DD', 'YYYY-MM-DD HH:MM[:SS]' or 'DD/MM/YYYY'; amounts
+are parsed by money.parse_amount. Imported rows belong to the importing
+user. Receipts without a number get the next numbers of their year's
+series, and are linked to the client of the same name when exactly one
+client has it (as in client_revenue.backfill).
+
+Duplicates are skipped: rows with the same date, amount and texts (see
+_key) as an earlier row of the file, found through a 16-byte hash of
+these fields, or as an existing row of the same user, found by one
+query per batch on the (user_id, date) index. Invalid rows are
+reported with their line number and skipped; the rest of the file is
+imported.
+"""
+
+import csv
+import hashlib
+from datetime import datetime
+
+from sqlalchemy import func, insert, select, tuple_
+from sqlalchemy.exc import DBAPIError
+
+import billing
+import money
+import numbering
+import rollup
+from database import db, Receipt, Expense, Client
+
+BATCH_SIZE = 5000
+MAX_ERRORS = 500  # per-row errors kept in the report (all are counted)
+_MAX_PARAMETERS = 30000  # per duplicate query, under SQLite's limit of 32766
+
+KINDS = ('expenses', 'receipts')
+PAYMENT_TYPES = ('recurring_monthly', 'one_time')
+REQUIRED_COLUMNS = {
+    'expenses': ['date', 'description', 'amount'],
+    'receipts': ['date', 'customer_name', 'price'],
+}
+
+_DATE_FORMATS = ('%d/%m/%Y', '%d/%m/%Y %H:%M', '%d/%m/%Y %H:%M:%S')
+
+
+def parse_date(value):
+    """Parse an import date; raises ValueError (in French) on bad input."""
+    text = (value or '').strip()
+    if not text:
+        raise ValueError('date requise')
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        pass
+    for date_format in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format)
+        except ValueError:
+            continue
+    raise ValueError(f'date invalide: {value!r}')
+
+
+def _text(record, name, max_length, required=False):
+    value = (record.get(name) or '').strip()
+    if required and not value:
+        raise ValueError(f'{name} requis')
+    if len(value) > max_length:
+        raise ValueError(f'{name} trop long ({max_length} caractères au plus)')
+    return value
+
+
+def _amount(record, name):
+    amount = money.parse_amount(record.get(name))
+    if amount <= 0:
+        raise ValueError(f'{name} doit être positif')
+    return amount
+
+
+def parse_expense(record):
+    """Column values of an expense row; raises ValueError on invalid data."""
+    return {
+        'date': parse_date(record.get('date')),
+        'description': _text(record, 'description', 200, required=True),
+        'amount': _amount(record, 'amount'),
+    }
+
+
+def parse_receipt(record):
+    """Column values of a receipt row (without user and client); raises ValueError on invalid data."""
+    payment_type = (record.get('payment_type') or '').strip() or 'one_time'
+    if payment_type not in PAYMENT_TYPES:
+        raise ValueError(f'payment_type invalide: {payment_type!r}')
+    payment_reason = _text(record, 'payment_reason', 200)
+    price = _amount(record, 'price')
+    description = _text(record, 'description', 200)
+    if not description:
+        # Same defaults as the receipt form
+        if payment_type == 'recurring_monthly':
+            description = billing.RECURRING_DESCRIPTION
+        else:
+            description = payment_reason or 'Paiement unique'
+    return {
+        'receipt_number': _text(record, 'receipt_number', 50),
+        'date': parse_date(record.get('date')),
+        'customer_name': _text(record, 'customer_name', 100, required=True),
+        'description': description,
+        'payment_type': payment_type,
+        'payment_reason': payment_reason,
+        'price': price,
+        'amount_in_letters': _text(record, 'amount_in_letters', 200) or billing.amount_in_letters(price),
+    }
+
+
+def _key(kind, values):
+    """The fields compared to detect duplicates."""
+    if kind == 'expenses':
+        return (values['date'], values['amount'], values['description'])
+    return (values['date'], values['price'], values['customer_name'], values['payment_type'],
+            values['description'], values['payment_reason'])
+
+
+def _row_hash(key):
+    text = '\x1f'.join(value.isoformat() if isinstance(value, datetime) else str(value) for value in key)
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+
+def _existing_hashes(kind, user_id, keys, max_id):
+    """Hashes of the `keys` that the user's rows (up to id `max_id`) already have."""
+    if kind == 'expenses':
+        model = Expense
+        columns = [Expense.date, Expense.amount, Expense.description]
+    else:
+        model = Receipt
+        columns = [Receipt.date, Receipt.price, Receipt.customer_name, Receipt.payment_type,
+                   Receipt.description, func.coalesce(Receipt.payment_reason, '')]
+    hashes = set()
+    # Each key binds its fields and at most one date
+    chunk_size = _MAX_PARAMETERS // (len(columns) + 1)
+    for start in range(0, len(keys), chunk_size):
+        chunk = keys[start:start + chunk_size]
+        query = (
+            select(*columns)
+            .where(model.user_id.is_(None) if user_id is None else model.user_id == user_id)
+            .where(model.date.in_({key[0] for key in chunk}))
+            .where(tuple_(*columns).in_(chunk))
+            .where(model.id <= max_id)
+        )
+        hashes.update(_row_hash(tuple(row)) for row in db.session.execute(query))
+    return hashes
+
+
+def _client_ids_by_name():
+    """{lower(trim(name)): id} of the client names that exactly one client has."""
+    key = func.lower(func.trim(Client.name))
+    query = select(key, func.min(Client.id)).group_by(key).having(func.count(Client.id) == 1)
+    return dict(db.session.execute(query).all())
+
+
+def _new_report():
+    return {'rows': 0, 'imported': 0, 'duplicates': 0, 'error_count': 0, 'errors': []}
+
+
+def _error(report, line, message):
+    report['error_count'] += 1
+    if len(report['errors']) < MAX_ERRORS:
+        report['errors'].append((line, message))
+
+
+class _Importer:
+    """Checks and writes the batches of parsed rows of one import, one transaction per batch."""
+
+    def __init__(self, kind, user_id, report, dry_run):
+        self.kind = kind
+        self.model = Expense if kind == 'expenses' else Receipt
+        self.user_id = user_id
+        self.report = report
+        self.dry_run = dry_run
+        self.seen = set()  # 16-byte hashes of the rows of the file imported so far
+        # Rows written by this import are found in `seen`, not in the database
+        self.max_id = db.session.scalar(select(func.max(self.model.id))) or 0
+        self.numbers = set()  # receipt numbers given in the file imported so far
+        self.clients = _client_ids_by_name() if kind == 'receipts' else {}
+
+    def _new_rows(self, batch):
+        """
+        The rows of `batch` that are neither duplicates nor invalid, with
+        their line numbers, and the hashes and receipt numbers they add.
+        """
+        keys = [_key(self.kind, values) for _, values in batch]
+        existing = _existing_hashes(self.kind, self.user_id, keys, self.max_id)
+        hashed = [(line, values, _row_hash(key)) for (line, values), key in zip(batch, keys)]
+        given_numbers = [values['receipt_number'] for _, values, _ in hashed if values.get('receipt_number')]
+        used_numbers = set(db.session.scalars(
+            select(Receipt.receipt_number).where(Receipt.receipt_number.in_(given_numbers)))) if given_numbers else set()
+
+        rows = []
+        hashes = set()
+        numbers = set()
+        for line, values, row_hash in hashed:
+            if row_hash in self.seen or row_hash in hashes or row_hash in existing:
+                self.report['duplicates'] += 1
+                continue
+            number = values.get('receipt_number')
+            if number and (number in used_numbers or number in self.numbers or number in numbers):
+                _error(self.report, line, f'receipt_number déjà utilisé: {number}')
+                continue
+            hashes.add(row_hash)
+            if number:
+                numbers.add(number)
+            rows.append((line, values))
+        return rows, hashes, numbers
+
+    def _complete_receipts(self, rows):
+        by_year = {}
+        for _, values in rows:
+            if not values['receipt_number']:
+                by_year.setdefault(values['date'].year, []).append(values)
+        for year, missing in by_year.items():
+            for values, number in zip(missing, numbering.allocate(len(missing), year)):
+                values['receipt_number'] = number
+        for _, values in rows:
+            values['client_id'] = self.clients.get(values['customer_name'].strip().lower())
+
+    def flush(self, batch):
+        rows, hashes, numbers = self._new_rows(batch)
+        if not rows or self.dry_run:
+            self.seen |= hashes
+            self.numbers |= numbers
+            self.report['imported'] += len(rows)
+            # End the read transaction of the batch
+            db.session.rollback()
+            return
+        if self.kind == 'receipts':
+            self._complete_receipts(rows)
+        amount_column = 'amount' if self.kind == 'expenses' else 'price'
+        deltas = {}
+        for _, values in rows:
+            values['user_id'] = self.user_id
+            month = rollup.month_key(values['date'])
+            deltas[month] = deltas.get(month, 0) + values[amount_column]
+        try:
+            db.session.execute(insert(self.model), [values for _, values in rows])
+            for month, total in deltas.items():
+                if self.kind == 'expenses':
+                    rollup.apply_delta(self.user_id, month, expenses=total)
+                else:
+                    rollup.apply_delta(self.user_id, month, income=total)
+            db.session.commit()
+        except DBAPIError as e:
+            db.session.rollback()
+            for line, _ in rows:
+                _error(self.report, line, f'lot rejeté par la base de données: {e.__class__.__name__}')
+            return
+        # Only committed rows make later rows of the file duplicates
+        self.seen |= hashes
+        self.numbers |= numbers
+        self.report['imported'] += len(rows)
+
+
+def import_csv(stream, kind, user_id, batch_size=BATCH_SIZE, dry_run=False):
+    """
+    Import the CSV rows of `stream` (a text file) as `kind` ('expenses' or
+    'receipts') owned by `user_id`. With dry_run, rows are validated and
+    checked for duplicates but nothing is written.
+
+    Returns a report dict: rows read, imported, duplicates, error_count and
+    errors, a list of (line number, message). Raises ValueError if the
+    header lacks a required column.
+    """
+    if kind not in KINDS:
+        raise ValueError(f'type inconnu: {kind!r}')
+    parse = parse_expense if kind == 'expenses' else parse_receipt
+    reader = csv.DictReader(stream)
+    header = [name.strip() for name in (reader.fieldnames or [])]
+    missing = [name for name in REQUIRED_COLUMNS[kind] if name not in header]
+    if missing:
+        raise ValueError(f"colonnes manquantes: {', '.join(missing)}")
+    reader.fieldnames = header
+
+    report = _new_report()
+    importer = _Importer(kind, user_id, report, dry_run)
+    batch = []
+    try:
+        for record in reader:
+            report['rows'] += 1
+            # Line of the row's end in the file (the header is line 1)
+            line = reader.line_num
+            try:
+                batch.append((line, parse(record)))
+            except ValueError as e:
+                _error(report, line, str(e))
+                continue
+            if len(batch) >= batch_size:
+                importer.flush(batch)
+                batch = []
+    except (csv.Error, UnicodeDecodeError) as e:
+        # Batches already written stay imported
+        _error(report, reader.line_num + 1, f'lecture interrompue: {e}')
+    if batch:
+        importer.flush(batch)
+    report['errors'].sort()
+    return report
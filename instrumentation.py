@@ -0,0 +1,289 @@
+"""
+Per-request timing instrumentation: Server-Timing headers and /metrics.
+
+For every request, SQLAlchemy cursor events count and time the SQL
+statements, Flask template signals time template rendering, and inline
+PDF renders are timed through timed('pdf'). The totals are returned in a
+Server-Timing header (visible in the browser's network panel):
+
+    Server-Timing: db;dur=12.4;desc="7 queries", tpl;dur=3.1, app;dur=18.0
+
+and accumulated per route for metrics_text(), which renders them in the
+Prometheus text format together with the database pool usage and the PDF
+render counters of render_queue.
+
+Each gunicorn worker has its own counters. Set METRICS_DIR to a directory
+shared by the workers to aggregate them: every worker writes a snapshot
+there at most every METRICS_FLUSH_INTERVAL seconds (and when scraped),
+and /metrics sums the snapshots. Gauges are only taken from live workers.
+
+The overhead is two perf_counter() calls per query and a few dict
+updates per request.
+"""
+
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request, template_rendered, before_render_template
+
+METRICS_DIR = os.getenv('METRICS_DIR') or None
+FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL') or 5)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_requests = {}   # (route, method, status) -> count
+_durations = {}  # (route, method) -> [count per bucket..., +Inf count, sum]
+_db = {}         # route -> [queries, seconds]
+_templates = {}  # route -> seconds
+_last_flush = 0.0
+_engine = None
+
+
+class _RequestTiming:
+    __slots__ = ('started', 'db_count', 'db_seconds', 'spans', 'template_starts')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_count = 0
+        self.db_seconds = 0.0
+        self.spans = {}
+        self.template_starts = []
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+
+def _current():
+    if has_request_context():
+        return g.get('request_timing')
+    return None
+
+
+@contextmanager
+def timed(name):
+    """Add the duration of the block to the current request's `name` Server-Timing entry."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing = _current()
+        if timing is not None:
+            timing.add(name, time.perf_counter() - started)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timing = _current()
+    if timing is not None:
+        timing.db_count += 1
+        timing.db_seconds += time.perf_counter() - context._query_started
+
+
+def _before_render_template(sender, template, context, **extra):
+    timing = _current()
+    if timing is not None:
+        timing.template_starts.append(time.perf_counter())
+
+
+def _template_rendered(sender, template, context, **extra):
+    timing = _current()
+    if timing is not None and timing.template_starts:
+        timing.add('tpl', time.perf_counter() - timing.template_starts.pop())
+
+
+def _before_request():
+    g.request_timing = _RequestTiming()
+
+
+def _after_request(response):
+    timing = g.pop('request_timing', None)
+    if timing is None:
+        return response
+    elapsed = time.perf_counter() - timing.started
+
+    entries = [f'db;dur={timing.db_seconds * 1000:.1f};desc="{timing.db_count} queries"']
+    entries += [f'{name};dur={seconds * 1000:.1f}' for name, seconds in timing.spans.items()]
+    entries.append(f'app;dur={elapsed * 1000:.1f}')
+    response.headers.add('Server-Timing', ', '.join(entries))
+
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    _observe(route, request.method, response.status_code, elapsed, timing)
+    return response
+
+
+def _observe(route, method, status, elapsed, timing):
+    with _lock:
+        key = (route, method, status)
+        _requests[key] = _requests.get(key, 0) + 1
+        histogram = _durations.setdefault((route, method), [0] * (len(BUCKETS) + 2))
+        for i, bound in enumerate(BUCKETS):
+            if elapsed <= bound:
+                histogram[i] += 1
+        histogram[-2] += 1
+        histogram[-1] += elapsed
+        db = _db.setdefault(route, [0, 0.0])
+        db[0] += timing.db_count
+        db[1] += timing.db_seconds
+        if 'tpl' in timing.spans:
+            _templates[route] = _templates.get(route, 0.0) + timing.spans['tpl']
+    if METRICS_DIR and time.monotonic() - _last_flush >= FLUSH_INTERVAL:
+        flush()
+
+
+def init_app(app, engine):
+    """Install the request hooks on `app` and the query hooks on `engine`."""
+    global _engine
+    from sqlalchemy import event
+
+    _engine = engine
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    before_render_template.connect(_before_render_template, app)
+    template_rendered.connect(_template_rendered, app)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+
+def _pool_stats():
+    pool = _engine.pool if _engine is not None else None
+    stats = {}
+    for name in ('size', 'checkedout', 'overflow', 'checkedin'):
+        method = getattr(pool, name, None)
+        if callable(method):
+            # QueuePool reports unused overflow capacity as a negative overflow
+            stats[name] = max(0, method())
+    return stats
+
+
+def snapshot():
+    """This worker's metrics as a JSON-serializable dict."""
+    import render_queue
+
+    with _lock:
+        return {
+            'pid': os.getpid(),
+            'requests': [[*key, count] for key, count in _requests.items()],
+            'durations': [[*key, values] for key, values in _durations.items()],
+            'db': [[route, *values] for route, values in _db.items()],
+            'templates': [[route, seconds] for route, seconds in _templates.items()],
+            'pool': _pool_stats(),
+            'pdf': render_queue.stats(),
+        }
+
+
+def flush():
+    """Write this worker's snapshot to METRICS_DIR (atomically)."""
+    global _last_flush
+    _last_flush = time.monotonic()
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = os.path.join(METRICS_DIR, f'worker-{os.getpid()}.json')
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot(), f)
+    os.replace(tmp_path, path)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _snapshots():
+    if not METRICS_DIR:
+        return [snapshot()]
+    flush()
+    snapshots = []
+    for path in glob.glob(os.path.join(METRICS_DIR, 'worker-*.json')):
+        try:
+            with open(path, encoding='utf-8') as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def _labels(**labels):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+def metrics_text():
+    """Render the (aggregated) metrics in the Prometheus text exposition format."""
+    requests, durations, db, templates = {}, {}, {}, {}
+    pool, pdf = {}, {}
+    for snap in _snapshots():
+        for route, method, status, count in snap['requests']:
+            requests[(route, method, status)] = requests.get((route, method, status), 0) + count
+        for route, method, values in snap['durations']:
+            total = durations.setdefault((route, method), [0] * len(values))
+            durations[(route, method)] = [a + b for a, b in zip(total, values)]
+        for route, queries, seconds in snap['db']:
+            current = db.setdefault(route, [0, 0.0])
+            current[0] += queries
+            current[1] += seconds
+        for route, seconds in snap['templates']:
+            templates[route] = templates.get(route, 0.0) + seconds
+        # Counters of dead workers still count; gauges only come from live ones
+        alive = _pid_alive(snap['pid'])
+        for name, value in snap['pdf'].items():
+            if name in ('queue_depth', 'workers', 'max_queue') and not alive:
+                continue
+            pdf[name] = pdf.get(name, 0) + value
+        if alive:
+            for name, value in snap['pool'].items():
+                pool[name] = pool.get(name, 0) + value
+
+    lines = [
+        '# HELP http_requests_total HTTP requests by route, method and status.',
+        '# TYPE http_requests_total counter',
+    ]
+    for (route, method, status), count in sorted(requests.items()):
+        lines.append(f'http_requests_total{_labels(route=route, method=method, status=status)} {count}')
+
+    lines += [
+        '# HELP http_request_duration_seconds Request handling time by route.',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    for (route, method), values in sorted(durations.items()):
+        for bound, count in zip(BUCKETS, values):
+            lines.append(f'http_request_duration_seconds_bucket{_labels(route=route, method=method, le=bound)} {count}')
+        lines.append(f'http_request_duration_seconds_bucket{_labels(route=route, method=method, le="+Inf")} {values[-2]}')
+        lines.append(f'http_request_duration_seconds_sum{_labels(route=route, method=method)} {values[-1]:.6f}')
+        lines.append(f'http_request_duration_seconds_count{_labels(route=route, method=method)} {values[-2]}')
+
+    lines += ['# HELP db_queries_total SQL statements executed by route.', '# TYPE db_queries_total counter']
+    lines += [f'db_queries_total{_labels(route=route)} {values[0]}' for route, values in sorted(db.items())]
+    lines += ['# HELP db_query_seconds_total Time spent in SQL statements by route.',
+              '# TYPE db_query_seconds_total counter']
+    lines += [f'db_query_seconds_total{_labels(route=route)} {values[1]:.6f}' for route, values in sorted(db.items())]
+    lines += ['# HELP template_render_seconds_total Time spent rendering templates by route.',
+              '# TYPE template_render_seconds_total counter']
+    lines += [f'template_render_seconds_total{_labels(route=route)} {seconds:.6f}'
+              for route, seconds in sorted(templates.items())]
+
+    lines += ['# HELP db_pool_connections Database pool connections by state (live workers).',
+              '# TYPE db_pool_connections gauge']
+    lines += [f'db_pool_connections{_labels(state=name)} {value}' for name, value in sorted(pool.items())]
+
+    lines += ['# HELP pdf_renders_total PDF renders by outcome.', '# TYPE pdf_renders_total counter']
+    for outcome in ('submitted', 'completed', 'failed', 'rejected'):
+        lines.append(f'pdf_renders_total{_labels(outcome=outcome)} {pdf.get(outcome, 0)}')
+    lines += ['# HELP pdf_render_seconds_total Time spent rendering PDFs that completed.',
+              '# TYPE pdf_render_seconds_total counter',
+              f'pdf_render_seconds_total {pdf.get("render_seconds", 0.0):.6f}',
+              '# HELP pdf_render_queue_depth PDF renders in flight (live workers).',
+              '# TYPE pdf_render_queue_depth gauge',
+              f'pdf_render_queue_depth {pdf.get("queue_depth", 0)}']
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,265 @@
+"""
+Versioned schema migrations.
+
+Applied migrations are recorded in the schema_migrations table. Run them
+once per deploy, before the web workers start:
+
+    python scripts/migrate.py            # apply pending migrations
+    python scripts/migrate.py status     # list applied and pending ones
+
+Importing app.py does no database work; the Docker image runs the
+migrations before starting gunicorn, and `python app.py` runs them before
+the development server.
+
+Each migration is a function of MIGRATIONS that works through db.session
+and is committed together with its schema_migrations row. Tables are
+created from the current models and migrations check the current schema
+before changing it, so databases created before this module (or by an
+interrupted run) are brought up to date without errors. New schema
+changes get a new entry at the end of MIGRATIONS; never remove or reorder
+applied ones.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import Integer, inspect, select, text, update
+
+from database import (db, User, Receipt, Expense, Client, MonthlyRollup, ReceiptSequence,
+                      CacheVersion, SchemaMigration, client_search_keys)
+
+# Arbitrary key of the PostgreSQL advisory lock held while migrating
+_LOCK_KEY = 7265102
+
+MONEY_COLUMNS = {
+    'receipt': ['price'],
+    'expense': ['amount'],
+    'client': ['installation_fee', 'monthly_payment'],
+    'monthly_rollup': ['income', 'expenses'],
+}
+
+
+def _connection():
+    return db.session.connection()
+
+
+def _create_tables(*models):
+    conn = _connection()
+    for model in models:
+        model.__table__.create(conn, checkfirst=True)
+
+
+def _create_indexes(*models):
+    """
+    Create the indexes declared on the models that the database lacks,
+    except those on columns that a later migration adds.
+    """
+    conn = _connection()
+    for model in models:
+        existing = _columns(model.__tablename__)
+        for index in model.__table__.indexes:
+            if all(column.name in existing for column in index.columns):
+                index.create(conn, checkfirst=True)
+
+
+def _columns(table):
+    return {column['name']: column['type'] for column in inspect(_connection()).get_columns(table)}
+
+
+def create_core_tables():
+    # Receipt references client (client_id)
+    _create_tables(User, Client, Receipt, Expense)
+
+
+def add_user_ids():
+    # Databases created before receipts and expenses belonged to a user
+    for table in ('receipt', 'expense'):
+        if 'user_id' not in _columns(table):
+            db.session.execute(text(f'ALTER TABLE {table} ADD COLUMN user_id INTEGER REFERENCES "user"(id)'))
+
+
+def create_client_table():
+    _create_tables(Client)
+
+
+def add_history_indexes():
+    _create_indexes(Receipt, Expense)
+
+
+def create_monthly_rollup():
+    import rollup
+
+    _create_tables(MonthlyRollup)
+    if rollup.needs_rebuild():
+        rollup.rebuild()
+
+
+def create_receipt_sequence():
+    _create_tables(ReceiptSequence)
+
+
+def _money_to_integer_postgres(table, columns):
+    for column in columns:
+        db.session.execute(text(
+            f'ALTER TABLE {table} ALTER COLUMN {column} TYPE BIGINT USING round({column})::bigint'))
+
+
+def _money_to_integer_sqlite(table, columns):
+    # SQLite cannot change a column type: rebuild the table
+    conn = _connection()
+    old_table = f'_{table}_old'
+    existing = list(_columns(table))
+    indexes = conn.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+        (table,),
+    ).scalars().all()
+    for index in indexes:
+        conn.exec_driver_sql(f'DROP INDEX {index}')
+    # Keep the foreign keys of other tables pointing at `table`, not at the old copy
+    conn.exec_driver_sql('PRAGMA legacy_alter_table = ON')
+    conn.exec_driver_sql(f'ALTER TABLE {table} RENAME TO {old_table}')
+    conn.exec_driver_sql('PRAGMA legacy_alter_table = OFF')
+    model_table = db.metadata.tables[table]
+    model_table.create(conn)
+
+    copied = [name for name in existing if name in model_table.c]
+    select_list = ', '.join(
+        f'CAST(round({name}) AS INTEGER)' if name in columns else name for name in copied)
+    conn.exec_driver_sql(
+        f'INSERT INTO {table} ({", ".join(copied)}) SELECT {select_list} FROM {old_table}')
+    conn.exec_driver_sql(f'DROP TABLE {old_table}')
+
+
+def money_to_integer():
+    """Store amounts as whole francs (BIGINT), rounding existing values."""
+    import rollup
+
+    converted = False
+    for table, columns in MONEY_COLUMNS.items():
+        types = _columns(table)
+        pending = [name for name in columns if name in types and not isinstance(types[name], Integer)]
+        if not pending:
+            continue
+        if db.engine.dialect.name == 'postgresql':
+            _money_to_integer_postgres(table, pending)
+        else:
+            _money_to_integer_sqlite(table, pending)
+        converted = True
+    if converted:
+        rollup.rebuild()
+
+
+def create_cache_version():
+    _create_tables(CacheVersion)
+
+
+def create_client_search_index():
+    import client_search
+
+    # Runs on its own connection; the client table must be committed first
+    db.session.commit()
+    client_search.ensure_index()
+
+
+def add_receipt_client_id():
+    import client_revenue
+
+    if 'client_id' not in _columns('receipt'):
+        db.session.execute(text(
+            'ALTER TABLE receipt ADD COLUMN client_id INTEGER REFERENCES client(id) ON DELETE SET NULL'))
+    _create_indexes(Receipt)
+    client_revenue.backfill()
+
+
+def create_text_search_index():
+    import text_search
+
+    # Runs on its own connection; the receipt and expense tables must be committed first
+    db.session.commit()
+    text_search.ensure_index()
+
+
+def add_client_search_keys():
+    import client_search
+
+    columns = _columns('client')
+    for name, length in (('name_key', 200), ('search_key', 802)):
+        if name not in columns:
+            db.session.execute(text(f'ALTER TABLE client ADD COLUMN {name} VARCHAR({length})'))
+    rows = [
+        dict(zip(('id', 'name_key', 'search_key'), (client_id, *client_search_keys(name, type_, address))))
+        for client_id, name, type_, address in db.session.execute(
+            select(Client.id, Client.name, Client.type, Client.address))
+    ]
+    if rows:
+        db.session.execute(update(Client), rows)
+    _create_indexes(Client)
+    # Runs on its own connection; the keys must be committed first
+    db.session.commit()
+    client_search.ensure_index(replace=True)
+
+
+def create_initial_admin():
+    from werkzeug.security import generate_password_hash
+
+    if User.query.filter_by(username='admin').first() is None:
+        db.session.add(User(username='admin', password_hash=generate_password_hash('admin')))
+        db.session.flush()
+        print("Created initial admin user with username 'admin' and password 'admin'")
+
+
+MIGRATIONS = [
+    (1, 'create_core_tables', create_core_tables),
+    (2, 'add_user_ids', add_user_ids),
+    (3, 'create_client_table', create_client_table),
+    (4, 'add_history_indexes', add_history_indexes),
+    (5, 'create_monthly_rollup', create_monthly_rollup),
+    (6, 'create_receipt_sequence', create_receipt_sequence),
+    (7, 'money_to_integer', money_to_integer),
+    (8, 'create_cache_version', create_cache_version),
+    (9, 'create_client_search_index', create_client_search_index),
+    (10, 'create_initial_admin', create_initial_admin),
+    (11, 'add_receipt_client_id', add_receipt_client_id),
+    (12, 'create_text_search_index', create_text_search_index),
+    (13, 'add_client_search_keys', add_client_search_keys),
+]
+
+
+def applied_versions():
+    """Return {version: applied_at} of the migrations applied to the database."""
+    if not inspect(db.engine).has_table(SchemaMigration.__tablename__):
+        return {}
+    return dict(db.session.query(SchemaMigration.version, SchemaMigration.applied_at).all())
+
+
+def pending():
+    """Return the (version, name, function) migrations not applied yet."""
+    applied = applied_versions()
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+
+def upgrade(log=print):
+    """Apply the pending migrations in order. Returns the names of those applied."""
+    lock = None
+    if db.engine.dialect.name == 'postgresql':
+        # Serialize concurrent runs (e.g. several containers starting at once)
+        lock = db.engine.connect()
+        lock.execute(text('SELECT pg_advisory_lock(:key)'), {'key': _LOCK_KEY})
+    try:
+        _create_tables(SchemaMigration)
+        db.session.commit()
+        done = []
+        for version, name, migrate in pending():
+            try:
+                migrate()
+                db.session.add(SchemaMigration(version=version, name=name, applied_at=datetime.now()))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            log(f"✓ {version:04d} {name}")
+            done.append(name)
+        return done
+    finally:
+        if lock is not None:
+            lock.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': _LOCK_KEY})
+            lock.close()
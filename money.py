@@ -0,0 +1,54 @@
+"""
+FCFA amounts: parsing of user input and formatting for display.
+
+Amounts are stored as whole francs in BigInteger columns (the franc CFA
+has no minor unit in use), so sums are exact and computed by the
+database. Input is rounded to the franc once, here, and amounts are
+formatted here only: templates through the `money` filter, JavaScript
+through the *_display strings that the JSON APIs add with display().
+"""
+
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+THOUSANDS_SEPARATOR = '\xa0'  # non-breaking space, so amounts never wrap
+CURRENCY = 'FCFA'
+
+
+def parse_amount(value, default=None):
+    """
+    Parse a user-entered amount into whole francs.
+
+    Accepts '25000', '25 000', '25000.50' or '25000,50' (rounded half up).
+    Returns `default` for blank input when a default is given; raises
+    ValueError on malformed input.
+    """
+    text = '' if value is None else str(value).strip()
+    if not text:
+        if default is not None:
+            return default
+        raise ValueError('montant requis')
+    text = ''.join(text.split()).replace(',', '.')
+    try:
+        amount = Decimal(text)
+    except InvalidOperation:
+        raise ValueError(f'montant invalide: {value!r}') from None
+    if not amount.is_finite():
+        raise ValueError(f'montant invalide: {value!r}')
+    return int(amount.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def format_amount(amount):
+    """Format whole francs with grouped thousands: 1250000 -> '1 250 000'."""
+    if amount is None:
+        amount = 0
+    return f"{int(round(amount)):,}".replace(',', THOUSANDS_SEPARATOR)
+
+
+def format_money(amount):
+    """Format whole francs with the currency: 1250000 -> '1 250 000 FCFA'."""
+    return f"{format_amount(amount)} {CURRENCY}"
+
+
+def display(data, *names):
+    """{name + '_display': formatted amount} of the `names` amounts of `data`, for JSON responses."""
+    return {f'{name}_display': format_money(data[name]) for name in names}
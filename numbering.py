@@ -0,0 +1,97 @@
+"""
+Receipt number allocation.
+
+Receipt numbers are human-readable per-year series: REC-2025-000042.
+Values come from a database counter that every gunicorn worker shares:
+- PostgreSQL: one sequence per year (receipt_number_seq_<year>), so
+  reservations never block each other
+- SQLite: a row per year in the receipt_sequence table
+
+Each worker reserves blocks of RECEIPT_NUMBER_BLOCK_SIZE values and hands
+them out from memory, so most receipts cost no database round-trip.
+Numbers are unique and increasing within a worker; with several workers
+they interleave by block, and unused values of a block are skipped when a
+worker exits (like any sequence, the series may have gaps). Set the block
+size to 1 for strictly increasing numbers across workers.
+
+Reservations run on their own connection and commit immediately; call
+allocate() before writing in the current transaction (SQLite only
+supports one writer at a time).
+"""
+
+import os
+import threading
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import insert, select, text, update
+from sqlalchemy.exc import IntegrityError, ProgrammingError
+
+from database import db, ReceiptSequence
+
+BLOCK_SIZE = int(os.getenv('RECEIPT_NUMBER_BLOCK_SIZE') or 20)
+
+_lock = threading.Lock()
+_available = {}
+_pg_sequences = set()
+
+
+def format_number(year, value):
+    return f"REC-{year}-{value:06d}"
+
+
+def _sequence_name(year):
+    return f"receipt_number_seq_{int(year)}"
+
+
+def _reserve_postgres(conn, year, count):
+    name = _sequence_name(year)
+    if name not in _pg_sequences:
+        conn.execute(text(f"CREATE SEQUENCE IF NOT EXISTS {name}"))
+        _pg_sequences.add(name)
+    return list(conn.execute(
+        text(f"SELECT nextval('{name}') FROM generate_series(1, :count)"),
+        {'count': count},
+    ).scalars())
+
+
+def _reserve_table(conn, year, count):
+    updated = conn.execute(
+        update(ReceiptSequence)
+        .where(ReceiptSequence.year == year)
+        .values(next_value=ReceiptSequence.next_value + count)
+    ).rowcount
+    if not updated:
+        conn.execute(insert(ReceiptSequence).values(year=year, next_value=1 + count))
+    end = conn.execute(select(ReceiptSequence.next_value).where(ReceiptSequence.year == year)).scalar()
+    return list(range(end - count, end))
+
+
+def _reserve(year, count):
+    """Reserve `count` values of `year`'s series in a short separate transaction."""
+    engine = db.engine
+    reserve = _reserve_postgres if engine.dialect.name == 'postgresql' else _reserve_table
+    for attempt in range(2):
+        try:
+            with engine.begin() as conn:
+                return reserve(conn, year, count)
+        except (IntegrityError, ProgrammingError):
+            # Another worker created the year's counter concurrently: retry once
+            _pg_sequences.discard(_sequence_name(year))
+            if attempt:
+                raise
+
+
+def allocate(count=1, year=None):
+    """Return `count` new receipt numbers of `year` (default: current year)."""
+    year = year or datetime.now().year
+    with _lock:
+        available = _available.setdefault(year, deque())
+        if len(available) < count:
+            available.extend(_reserve(year, max(BLOCK_SIZE, count - len(available))))
+        return [format_number(year, available.popleft()) for _ in range(count)]
+
+
+def next_number(year=None):
+    """Return a single new receipt number."""
+    return allocate(1, year)[0]
@@ -0,0 +1,155 @@
+"""
+Content-addressed cache for rendered receipt PDFs.
+
+Entries are keyed by the SHA-256 of the rendering engine and its input
+(the receipt HTML, or the receipt fields for the direct engine), which is
+a function of every receipt field shown on the PDF and of the template
+itself. Editing a receipt (or the template), or switching engines,
+therefore produces a new key and naturally misses the cache; stale
+entries age out through eviction.
+
+The cache lives in receipts/cache/ (the `receipts` Docker volume) and is
+capped at PDF_CACHE_MAX_BYTES, counting the render failure markers
+(<key>.err, see render_queue.py) and the temporary files of renders in
+progress. Eviction is least-recently-used: a hit touches the file's mtime,
+and the oldest PDFs and markers are removed first, down to EVICT_TO of
+the cap so that the next stores do not evict again. Temporary files older
+than ORPHAN_SECONDS, left by crashed renders, are removed by every scan.
+
+Each process tracks the cache size from its last directory scan plus the
+PDFs it stored since, and only scans (to evict) when that size exceeds
+the cap or every RESCAN_EVERY stores, which picks up the files of the
+other processes. Bulk renders therefore do not scan the directory per PDF.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+CACHE_DIR = os.path.abspath(os.getenv('PDF_CACHE_DIR') or os.path.join('receipts', 'cache'))
+MAX_BYTES = int(os.getenv('PDF_CACHE_MAX_BYTES') or 200 * 1024 * 1024)
+EVICT_TO = 0.9
+RESCAN_EVERY = 100
+ORPHAN_SECONDS = 3600
+
+_lock = threading.Lock()
+_tracked_bytes = None  # cache size seen by this process, None until the first scan
+_stores_since_scan = 0
+
+
+def cache_key(content, engine):
+    """Return the cache key of the PDF that `engine` renders from `content`."""
+    return hashlib.sha256(f'{engine}\n{content}'.encode('utf-8')).hexdigest()
+
+
+def path_for(key):
+    """Return the path of the cache entry for `key` (whether or not it exists)."""
+    return os.path.join(CACHE_DIR, f'{key}.pdf')
+
+
+def lookup(key):
+    """Return the cached PDF path for `key` and mark it as recently used, or None."""
+    path = path_for(key)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+def store(key, render):
+    """
+    Render a PDF into the cache and return its path.
+
+    `render` is called with a temporary path to write the PDF to; the file
+    is moved into place atomically so concurrent readers never see a
+    partial PDF. Eviction runs when the tracked cache size exceeds the cap.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, prefix=f'.{key[:16]}-', suffix='.tmp')
+    os.close(fd)
+    try:
+        render(tmp_path)
+        path = path_for(key)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    if _track_store(size):
+        evict()
+    return path
+
+
+def track(path):
+    """Count a file written into the cache outside store() (a failure marker); evicts if needed."""
+    try:
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        return
+    if _track_store(size):
+        evict()
+
+
+def _track_store(size):
+    """Add a stored file to the tracked size; True when the cache should be scanned."""
+    global _tracked_bytes, _stores_since_scan
+    with _lock:
+        _stores_since_scan += 1
+        if _tracked_bytes is None:
+            return True
+        _tracked_bytes += size
+        return _tracked_bytes > MAX_BYTES or _stores_since_scan >= RESCAN_EVERY
+
+
+def evict(max_bytes=None):
+    """
+    Scan the cache and, if it exceeds `max_bytes`, delete least-recently-used
+    PDFs and failure markers until it fits in EVICT_TO of `max_bytes`.
+    Orphaned temporary files are deleted in any case. Returns the number of
+    files deleted.
+    """
+    global _tracked_bytes, _stores_since_scan
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    total = 0
+    removed = 0
+    orphaned_before = time.time() - ORPHAN_SECONDS
+    try:
+        with os.scandir(CACHE_DIR) as it:
+            for entry in it:
+                temporary = entry.name.endswith('.tmp')
+                if not temporary and not entry.name.endswith(('.pdf', '.err')):
+                    continue
+                try:
+                    stat = entry.stat()
+                    if temporary and stat.st_mtime < orphaned_before:
+                        os.remove(entry.path)
+                        removed += 1
+                        continue
+                except FileNotFoundError:
+                    continue
+                total += stat.st_size
+                # Temporary files of renders in progress count, but are not evicted
+                if not temporary:
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+    except FileNotFoundError:
+        return 0
+
+    target = total if total <= max_bytes else int(max_bytes * EVICT_TO)
+    entries.sort()
+    for _, size, path in entries:
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    with _lock:
+        _tracked_bytes = total
+        _stores_since_scan = 0
+    return removed
@@ -0,0 +1,103 @@
+"""
+Receipt PDF rendering, initialized once per process.
+
+RECEIPT_PDF_ENGINE selects how receipts become PDFs:
+- weasyprint (default): receipt_template.html laid out by WeasyPrint
+- direct: the receipt fields written at fixed positions by receipt_pdf.py,
+  without HTML layout or native libraries (much cheaper per receipt)
+
+The engine is part of the PDF cache key (job_id()), so switching engines
+re-renders receipts instead of serving PDFs of the other engine.
+
+Importing WeasyPrint, scanning fonts with fontconfig and parsing the
+receipt stylesheet take a large part of a first render. warm_up() does all
+of it ahead of time and keeps the results:
+- gunicorn workers call render_queue.start() once they have loaded the
+  app (see gunicorn.conf.py), which also compiles receipt_template.html
+- render_queue pool processes call it as their initializer
+
+The stylesheet lives in static/css/receipt.css and is parsed once into a
+CSS object shared by every render. Receipt HTML only references its
+version (STYLESHEET_VERSION), so editing it changes the PDF cache keys.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+import pdf_cache
+import receipt_pdf
+
+ENGINES = ('weasyprint', 'direct')
+ENGINE = os.getenv('RECEIPT_PDF_ENGINE') or 'weasyprint'
+if ENGINE not in ENGINES:
+    raise ValueError(f"RECEIPT_PDF_ENGINE must be one of {', '.join(ENGINES)}, not {ENGINE!r}")
+
+STYLESHEET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'css', 'receipt.css')
+TEMPLATE_NAME = 'receipt_template.html'
+
+with open(STYLESHEET_PATH, encoding='utf-8') as _f:
+    STYLESHEET = _f.read()
+STYLESHEET_VERSION = hashlib.sha256(STYLESHEET.encode('utf-8')).hexdigest()[:16]
+
+# Minimal document rendered by warm_up() so fonts are resolved before the first receipt
+_SAMPLE_HTML = '<p class="details"><strong>Reçu</strong> 0123456789 FCFA</p>'
+
+_lock = threading.Lock()
+_renderer = None  # (HTML class, FontConfiguration, stylesheet CSS)
+
+
+def _load():
+    global _renderer
+    with _lock:
+        if _renderer is None:
+            from weasyprint import CSS, HTML
+            from weasyprint.text.fonts import FontConfiguration
+
+            font_config = FontConfiguration()
+            stylesheet = CSS(string=STYLESHEET, font_config=font_config)
+            _renderer = (HTML, font_config, stylesheet)
+    return _renderer
+
+
+def warm_up(engine=None):
+    """
+    Load WeasyPrint, resolve fonts and parse the stylesheet. Returns False
+    when WeasyPrint cannot be loaded (renders then fail and downloads fall
+    back to HTML). The direct engine is ready once imported.
+    """
+    if (engine or ENGINE) == 'direct':
+        return True
+    try:
+        html_class, font_config, stylesheet = _load()
+        html_class(string=_SAMPLE_HTML).write_pdf(stylesheets=[stylesheet], font_config=font_config)
+    except Exception as e:
+        print("PDF renderer unavailable:", e)
+        return False
+    return True
+
+
+def is_ready():
+    return ENGINE == 'direct' or _renderer is not None
+
+
+def job_id(source):
+    """PDF cache key of a render `source` (see render())."""
+    if ENGINE == 'direct':
+        content = json.dumps(source, sort_keys=True, ensure_ascii=False)
+        return pdf_cache.cache_key(content, f'direct-{receipt_pdf.LAYOUT_VERSION}')
+    return pdf_cache.cache_key(source, ENGINE)
+
+
+def render(source, target, engine=None):
+    """
+    Write a receipt PDF to the `target` path with `engine` (default:
+    ENGINE). `source` is the receipt HTML for WeasyPrint, or
+    receipt_pdf.receipt_fields() for the direct engine.
+    """
+    if (engine or ENGINE) == 'direct':
+        receipt_pdf.write(source, target)
+        return
+    html_class, font_config, stylesheet = _load()
+    html_class(string=source).write_pdf(target, stylesheets=[stylesheet], font_config=font_config)
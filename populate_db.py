@@ -15,11 +15,14 @@ Usage:
 
 from app import app, db
 from database import Receipt, Expense
+import migrations
 from datetime import datetime, timedelta
 import random
 
 def populate_database():
     with app.app_context():
+        migrations.upgrade()
+
         # Clear existing data (optional)
         print("Clearing existing data...")
         Receipt.query.delete()
@@ -0,0 +1,172 @@
+"""
+Opt-in cProfile profiling of sampled and slow requests.
+
+ProfilerMiddleware wraps the WSGI app. It is installed only when one of
+these is set:
+- PROFILE_SAMPLE_RATE: fraction of requests to profile (e.g. 0.01)
+- PROFILE_SLOW_MS: keep the profile of any request slower than this.
+  Every candidate request then runs under cProfile (roughly 1.5-2x
+  slower), so restrict it with PROFILE_PATHS.
+- PROFILE_PATHS: comma-separated path prefixes eligible for profiling
+  (e.g. /dashboard,/receipt/download); all paths when empty
+
+Profiles are pstats files (readable with pstats, snakeviz, or flameprof
+for flame graphs) written to PROFILE_DIR (default profiles/, next to
+receipts/). Only the PROFILE_MAX_FILES newest are kept. Streamed
+responses are profiled until their last chunk is sent. Admins can list
+and download profiles at /admin/profiles.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import random
+import re
+import time
+from collections import namedtuple
+from datetime import datetime
+
+PROFILE_DIR = os.path.abspath(os.getenv('PROFILE_DIR') or 'profiles')
+SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE') or 0)
+SLOW_MS = float(os.getenv('PROFILE_SLOW_MS') or 0)
+PATHS = tuple(p.strip() for p in (os.getenv('PROFILE_PATHS') or '').split(',') if p.strip())
+MAX_FILES = int(os.getenv('PROFILE_MAX_FILES') or 100)
+
+_NAME_RE = re.compile(r'^(?P<stamp>\d{8}-\d{6}-\d{6})-(?P<method>[A-Z]+)-(?P<slug>[\w.-]*)-(?P<ms>\d+)ms\.prof$')
+
+Profile = namedtuple('Profile', ['name', 'method', 'slug', 'duration_ms', 'created_at', 'size'])
+
+
+def enabled():
+    return SAMPLE_RATE > 0 or SLOW_MS > 0
+
+
+def is_valid_name(name):
+    return bool(_NAME_RE.match(name or ''))
+
+
+def path_for(name):
+    return os.path.join(PROFILE_DIR, name)
+
+
+def _slug(path):
+    return re.sub(r'[^\w.-]+', '_', path.strip('/'))[:80] or 'root'
+
+
+def _save(profile, method, path, duration_ms):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{method}-{_slug(path)}-{duration_ms:.0f}ms.prof"
+    profile.dump_stats(path_for(name))
+    _rotate()
+    return name
+
+
+def _rotate():
+    names = sorted(name for name in os.listdir(PROFILE_DIR) if is_valid_name(name))
+    for name in names[:max(0, len(names) - MAX_FILES)]:
+        try:
+            os.remove(path_for(name))
+        except FileNotFoundError:
+            pass
+
+
+def list_profiles():
+    """Return the saved profiles, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        match = _NAME_RE.match(name)
+        if not match:
+            continue
+        try:
+            size = os.path.getsize(path_for(name))
+        except FileNotFoundError:
+            continue
+        profiles.append(Profile(name, match['method'], match['slug'], int(match['ms']),
+                                datetime.strptime(match['stamp'], '%Y%m%d-%H%M%S-%f'), size))
+    return profiles
+
+
+def summary(name, limit=40):
+    """Text report of a profile's most expensive functions by cumulative time."""
+    out = io.StringIO()
+    stats = pstats.Stats(path_for(name), stream=out)
+    stats.strip_dirs().sort_stats('cumulative').print_stats(limit)
+    return out.getvalue()
+
+
+class _ProfiledBody:
+    """Response iterable that keeps profiling while a streamed body is produced."""
+
+    def __init__(self, body, profile, finish):
+        self._body = body
+        self._profile = profile
+        self._finish = finish
+
+    def __iter__(self):
+        iterator = iter(self._body)
+        while True:
+            self._profile.enable()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._profile.disable()
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self._body, 'close'):
+                self._body.close()
+        finally:
+            self._finish()
+
+
+class ProfilerMiddleware:
+    """WSGI middleware profiling sampled and slow requests with cProfile."""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def _eligible(self, environ):
+        path = environ.get('PATH_INFO', '')
+        if PATHS and not path.startswith(PATHS):
+            return None
+        if SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE:
+            return 'sampled'
+        if SLOW_MS > 0:
+            return 'slow'
+        return None
+
+    def __call__(self, environ, start_response):
+        reason = self._eligible(environ)
+        if reason is None:
+            return self.wsgi_app(environ, start_response)
+
+        profile = cProfile.Profile()
+        started = time.perf_counter()
+
+        def finish():
+            duration_ms = (time.perf_counter() - started) * 1000
+            if reason == 'sampled' or duration_ms >= SLOW_MS:
+                try:
+                    _save(profile, environ.get('REQUEST_METHOD', 'GET'), environ.get('PATH_INFO', '/'), duration_ms)
+                except OSError as e:
+                    print("Could not save profile:", e)
+
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is already active in this process
+            return self.wsgi_app(environ, start_response)
+        try:
+            body = self.wsgi_app(environ, start_response)
+        except Exception:
+            profile.disable()
+            finish()
+            raise
+        profile.disable()
+        return _ProfiledBody(body, profile, finish)
@@ -0,0 +1,247 @@
+"""
+Direct PDF writer for receipts (RECEIPT_PDF_ENGINE=direct).
+
+Receipts are a fixed one-page layout, so this engine writes the PDF
+without HTML layout: the fields of receipt_template.html are placed at
+fixed positions on an A4 page in the standard Helvetica fonts (which PDF
+viewers provide, so nothing is embedded). Only the Python standard
+library is used; no Cairo or Pango.
+
+Everything that does not depend on the receipt (the font and page
+objects, the header, labels and the signature/stamp block) is compiled
+into bytes once at import. A render formats the fields, wraps the long
+ones, and writes the content stream and cross-reference table.
+
+Text is encoded in WinAnsi (cp1252), which covers French; other
+characters are written as '?'. scripts/verify_receipt_pdf.py checks that
+the text matches the HTML template. Bump LAYOUT_VERSION when the output
+changes, so cached PDFs are re-rendered.
+"""
+
+import re
+import unicodedata
+
+import money
+
+LAYOUT_VERSION = '1'
+
+PAGE_WIDTH, PAGE_HEIGHT = 595.28, 841.89  # A4 in points
+MARGIN = 72
+CONTENT_WIDTH = PAGE_WIDTH - 2 * MARGIN
+
+FONTS = {'F1': 'Helvetica', 'F2': 'Helvetica-Bold', 'F3': 'Helvetica-Oblique'}
+
+PAYMENT_TYPE_LABELS = {
+    'recurring_monthly': 'Paiement Mensuel Récurrent',
+    'one_time': 'Paiement Unique',
+}
+
+# Advance widths (1/1000 em) of printable ASCII, from the Adobe font metrics
+_ASCII = ''.join(chr(c) for c in range(32, 127))
+_HELVETICA = dict(zip(_ASCII, (
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+)))
+_HELVETICA_BOLD = dict(zip(_ASCII, (
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+)))
+_WIDTHS = {'F1': _HELVETICA, 'F2': _HELVETICA_BOLD, 'F3': _HELVETICA}
+_EXTRA_WIDTHS = {'\xa0': 278, '°': 400, '€': 556, '’': 222, '«': 556, '»': 556, '–': 556, '—': 1000}
+
+# Colors of receipt.css
+_TEXT = '0.2 g'          # #333
+_MUTED = '0.4 g'         # #666
+_ACCENT = '0 0.737 0.831 rg'  # #00bcd4
+_BOX = '0.976 g'         # #f9f9f9
+_LINE = '0.2 G'          # #333 (stroke)
+_DASHED = '0.6 G'        # #999 (stroke)
+
+
+def _char_width(char, font):
+    widths = _WIDTHS[font]
+    if char in widths:
+        return widths[char]
+    if char in _EXTRA_WIDTHS:
+        return _EXTRA_WIDTHS[char]
+    # Accented letters are as wide as their base letter
+    base = unicodedata.normalize('NFD', char)[:1]
+    return widths.get(base, 556)
+
+
+def text_width(text, font, size):
+    return sum(_char_width(char, font) for char in text) * size / 1000
+
+
+def _pdf_string(text):
+    data = text.encode('cp1252', errors='replace')
+    return b'(' + data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def _text(x, y, runs, size, color=_TEXT):
+    """Content stream ops drawing `runs` [(font, text)] from (x, y)."""
+    ops = [f'BT {color} {x:.2f} {y:.2f} Td '.encode()]
+    for font, text in runs:
+        ops.append(f'/{font} {size} Tf '.encode() + _pdf_string(text) + b' Tj ')
+    ops.append(b'ET\n')
+    return b''.join(ops)
+
+
+def _centered(y, font, text, size, color=_TEXT, left=MARGIN, width=CONTENT_WIDTH):
+    x = left + (width - text_width(text, font, size)) / 2
+    return _text(x, y, [(font, text)], size, color)
+
+
+def _field_lines(label, value, size, width, font='F1'):
+    """
+    Lay out 'label value' in lines of at most `width` points (the bold
+    label starts the first line). Returns a list of [(font, text)] runs.
+    """
+    lines = []
+    runs = [('F2', label)] if label else []
+    used = text_width(label, 'F2', size)
+    for word in value.split():
+        separator = ' ' if runs else ''
+        word_width = text_width(separator + word, font, size)
+        if used + word_width > width and any(run_font == font for run_font, _ in runs):
+            lines.append(runs)
+            runs, separator = [], ''
+            used, word_width = 0, text_width(word, font, size)
+        if runs and runs[-1][0] == font:
+            runs[-1] = (font, runs[-1][1] + separator + word)
+        else:
+            runs.append((font, separator + word))
+        used += word_width
+    lines.append(runs)
+    return lines
+
+
+def receipt_fields(receipt):
+    """The texts printed on a receipt, as a JSON-serializable dict."""
+    return {
+        'receipt_number': receipt.receipt_number or '',
+        'date': receipt.date.strftime("%Y-%m-%d %H:%M:%S") if receipt.date else '',
+        'name': receipt.customer_name or '',
+        'description': receipt.description or '',
+        'payment_type': PAYMENT_TYPE_LABELS.get(receipt.payment_type, ''),
+        'payment_reason': (receipt.payment_reason or '') if receipt.payment_type == 'one_time' else '',
+        'price': f"{money.format_amount(receipt.price)} FCFA",
+        'amount_in_letters': receipt.amount_in_letters or '',
+    }
+
+
+def _compile_objects():
+    """The page objects that never change, with the number the content stream must use."""
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        (f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] '
+         f'/Resources << /Font << ' + ' '.join(f'/{name} {5 + i} 0 R' for i, name in enumerate(FONTS))
+         + ' >> >> /Contents 4 0 R >>').encode(),
+        None,  # content stream
+    ]
+    for base_font in FONTS.values():
+        objects.append(f'<< /Type /Font /Subtype /Type1 /BaseFont /{base_font} '
+                       f'/Encoding /WinAnsiEncoding >>'.encode())
+    return objects
+
+
+_OBJECTS = _compile_objects()
+_HEADER = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+_TOP = PAGE_HEIGHT - MARGIN
+_BOX_TOP = _TOP - 112
+_LINE_HEIGHT = 19
+_BOX_PADDING = 15
+_HEADING = b''.join([
+    _centered(_TOP - 40, 'F2', 'Reçu', 24),
+    _centered(_TOP - 68, 'F2', 'Paiement à Marate AI', 13.5, _ACCENT),
+])
+
+
+def _signature_block(top):
+    column = (CONTENT_WIDTH - 15) / 2
+    stamp_left = MARGIN + column + 15
+    line_y = top - 45
+    return b''.join([
+        f'{_LINE} 1.5 w {MARGIN:.2f} {line_y:.2f} m {MARGIN + column:.2f} {line_y:.2f} l S\n'.encode(),
+        _centered(line_y - 18, 'F1', 'Signature', 10.5, _MUTED, MARGIN, column),
+        f'{_DASHED} 1.5 w [4 3] 0 d {stamp_left:.2f} {top - 75:.2f} {column:.2f} 75 re S [] 0 d\n'.encode(),
+        _centered(top - 41, 'F1', 'CACHET', 10.5, '0.6 g', stamp_left, column),
+    ])
+
+
+def _content(fields):
+    size = 12
+    number_runs = [('F2', 'Reçu N°: '), ('F1', fields['receipt_number'])]
+    number_width = sum(text_width(text, font, 10.5) for font, text in number_runs)
+
+    width = CONTENT_WIDTH - 2 * _BOX_PADDING
+    lines = _field_lines('Client:', fields['name'], size, width)
+    lines += _field_lines('Description:', fields['description'], size, width)
+    lines += _field_lines('Type de Paiement:', fields['payment_type'], size, width)
+    if fields['payment_reason']:
+        lines += _field_lines('', 'Raison: ' + fields['payment_reason'], size, width, font='F3')
+    lines += _field_lines('Prix:', fields['price'], size, width)
+    lines += _field_lines('Montant en Lettres:', fields['amount_in_letters'], size, width)
+
+    box_height = 2 * _BOX_PADDING + (len(lines) - 1) * _LINE_HEIGHT + size
+    box_bottom = _BOX_TOP - box_height
+    parts = [
+        _text(PAGE_WIDTH - MARGIN - number_width, _TOP, number_runs, 10.5, _MUTED),
+        _HEADING,
+        _centered(_TOP - 90, 'F1', f"Date: {fields['date']}", size),
+        f'{_BOX} {MARGIN:.2f} {box_bottom:.2f} {CONTENT_WIDTH:.2f} {box_height:.2f} re f\n'.encode(),
+    ]
+    y = _BOX_TOP - _BOX_PADDING - size
+    for runs in lines:
+        parts.append(_text(MARGIN + _BOX_PADDING, y, runs, size))
+        y -= _LINE_HEIGHT
+    parts.append(_signature_block(box_bottom - 30))
+    return b''.join(parts)
+
+
+def render(fields):
+    """Return the PDF bytes of a receipt from receipt_fields()."""
+    content = _content(fields)
+    objects = list(_OBJECTS)
+    objects[3] = b'<< /Length %d >>\nstream\n' % len(content) + content + b'\nendstream'
+
+    out = bytearray(_HEADER)
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    out += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def write(fields, path):
+    with open(path, 'wb') as f:
+        f.write(render(fields))
+
+
+_STRING_RE = re.compile(rb'\(((?:\\.|[^\\)])*)\) Tj|(ET)')
+
+
+def extract_text(pdf):
+    """Text of a PDF written by render(), one string per text object (used for verification)."""
+    texts, current = [], []
+    for match in _STRING_RE.finditer(pdf):
+        if match.group(2):
+            texts.append(''.join(current))
+            current = []
+        else:
+            raw = re.sub(rb'\\(.)', rb'\1', match.group(1))
+            current.append(raw.decode('cp1252'))
+    return texts
@@ -0,0 +1,185 @@
+"""
+Receivables: expected versus received monthly payments per client.
+
+The expected schedule has one row per client and month in which the
+client owes its monthly_payment:
+- active clients from the month of their start date, up to their end
+  date if they have one
+- stopped clients up to their end date (stopped clients without an end
+  date are not scheduled)
+It is compared with the 'recurring_monthly' receipts linked to the
+client (Receipt.client_id) in the same month. Receipts of unlinked or
+deleted clients are not counted, and a payment above the monthly amount
+is credited to the other months of the period.
+
+The balances are computed in SQL for all clients at once: the months of
+the period are a VALUES list joined with the clients, receipts are
+grouped by (client, month), and the join is aggregated per client in a
+single statement. Its cost depends on clients x months and on the
+receipts of the period, never on per-client queries.
+"""
+
+import hashlib
+from datetime import date
+
+from sqlalchemy import Date, String, and_, case, column, func, or_, select, values
+
+import billing
+import client_cache
+from database import db, Receipt, Client, CacheVersion
+from reporting import amount_sum, data_version, month_bucket
+
+DEFAULT_MONTHS = 12
+MAX_MONTHS = 120
+
+
+def month_range(start, end):
+    """First days (dates) of the months from `start` to `end` included."""
+    months = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        months.append(date(year, month, 1))
+        year, month = (year, month + 1) if month < 12 else (year + 1, 1)
+    return months
+
+
+def default_period(today=None):
+    """The last DEFAULT_MONTHS months, ending with the current one."""
+    today = today or date.today()
+    end = date(today.year, today.month, 1)
+    year, month = divmod(end.year * 12 + end.month - 1 - (DEFAULT_MONTHS - 1), 12)
+    return date(year, month + 1, 1), end
+
+
+def parse_period(start_value, end_value, today=None):
+    """
+    Parse 'YYYY-MM' bounds (either may be empty) into (start, end) month
+    dates. The end is capped at the current month, since later months are
+    not due yet. Raises ValueError on invalid or too long periods.
+    """
+    today = today or date.today()
+    start, end = default_period(today)
+    if end_value:
+        end = min(billing.parse_month(end_value).date(), end)
+    if start_value:
+        start = billing.parse_month(start_value).date()
+    if start > end:
+        raise ValueError('start after end')
+    if len(month_range(start, end)) > MAX_MONTHS:
+        raise ValueError('period too long')
+    return start, end
+
+
+def _months_table(months):
+    rows = []
+    for month_start in months:
+        _, month_end = billing.month_bounds(month_start)
+        rows.append((month_start.strftime('%Y-%m'), month_start, month_end))
+    return values(
+        column('month', String(7)), column('month_start', Date), column('month_end', Date),
+        name='months',
+    ).data(rows).cte('months')
+
+
+def _balances(start, end):
+    """Select the expected, received and unpaid months of every scheduled client."""
+    months = _months_table(month_range(start, end))
+    schedule = (
+        select(Client.id.label('client_id'), months.c.month, Client.monthly_payment.label('expected'))
+        .join_from(Client, months, and_(
+            Client.start_date < months.c.month_end,
+            or_(Client.end_date.is_(None), Client.end_date >= months.c.month_start),
+        ))
+        .where(Client.monthly_payment > 0)
+        .where(or_(Client.status == 'active', and_(Client.status == 'stopped', Client.end_date.isnot(None))))
+        .cte('schedule')
+    )
+
+    period_start, _ = billing.month_bounds(start)
+    _, period_end = billing.month_bounds(end)
+    bucket = month_bucket(Receipt.date)
+    received = (
+        select(Receipt.client_id, bucket.label('month'), amount_sum(Receipt.price).label('amount'))
+        .where(Receipt.client_id.isnot(None))
+        .where(Receipt.payment_type == 'recurring_monthly')
+        .where(Receipt.date >= period_start, Receipt.date < period_end)
+        .group_by(Receipt.client_id, bucket)
+        .cte('received')
+    )
+
+    paid = func.coalesce(received.c.amount, 0)
+    unpaid = paid < schedule.c.expected
+    return (
+        select(
+            schedule.c.client_id,
+            amount_sum(schedule.c.expected).label('expected'),
+            amount_sum(paid).label('received'),
+            func.sum(case((unpaid, 1), else_=0)).label('unpaid_months'),
+            func.min(case((unpaid, schedule.c.month))).label('oldest_unpaid'),
+        )
+        .select_from(schedule)
+        .outerjoin(received, and_(received.c.client_id == schedule.c.client_id,
+                                  received.c.month == schedule.c.month))
+        .group_by(schedule.c.client_id)
+        .subquery('balances')
+    )
+
+
+def outstanding(start, end, limit=None):
+    """
+    Return the receivables of the months `start` to `end` (month dates).
+
+    The result has the period totals ('expected', 'received',
+    'outstanding', 'clients' behind) and 'items': the clients with an
+    outstanding balance, largest first, as dicts with client_id, name,
+    monthly_payment, expected, received, outstanding, unpaid_months and
+    oldest_unpaid ('YYYY-MM'). `limit` only limits the items.
+    """
+    balances = _balances(start, end)
+    balance = balances.c.expected - balances.c.received
+    query = (
+        select(Client.id, Client.name, Client.monthly_payment, balances.c.expected, balances.c.received,
+               balances.c.unpaid_months, balances.c.oldest_unpaid)
+        .join(balances, balances.c.client_id == Client.id)
+        .order_by(balance.desc(), Client.name)
+    )
+    # One row per scheduled client: the totals are summed here
+    expected_total = received_total = outstanding_total = 0
+    items = []
+    rows = db.session.execute(query)
+    for client_id, name, monthly_payment, expected, received, unpaid_months, oldest_unpaid in rows:
+        expected_total += expected
+        received_total += received
+        if expected <= received:
+            continue
+        outstanding_total += expected - received
+        items.append({
+            'client_id': client_id,
+            'name': name,
+            'monthly_payment': monthly_payment,
+            'expected': expected,
+            'received': received,
+            'outstanding': expected - received,
+            'unpaid_months': int(unpaid_months),
+            'oldest_unpaid': oldest_unpaid,
+        })
+    return {
+        'start': start.strftime('%Y-%m'),
+        'end': end.strftime('%Y-%m'),
+        'expected': expected_total,
+        'received': received_total,
+        'outstanding': outstanding_total,
+        'clients': len(items),
+        'items': items[:limit] if limit else items,
+    }
+
+
+def etag(start, end, limit=None):
+    """
+    Strong ETag of a receivables report: changes with the receipts (the
+    company rollup version) and the clients (their cache version).
+    """
+    clients_version = db.session.scalar(
+        select(CacheVersion.version).where(CacheVersion.name == client_cache.VERSION_NAME))
+    marker = f"receivables-v2:{start:%Y-%m}:{end:%Y-%m}:{limit}:{data_version()}:{clients_version}"
+    return hashlib.sha1(marker.encode('utf-8')).hexdigest()
@@ -0,0 +1,222 @@
+"""
+Background rendering of receipt PDFs.
+
+WeasyPrint layout is CPU-bound and used to run inline in the gunicorn
+request worker, so a couple of concurrent downloads could block the whole
+site. Renders are now submitted to a small local process pool and the
+request returns immediately with a job id.
+
+The job id is the content-hash cache key from pdf_cache, so job state is
+visible to every gunicorn worker through the shared cache directory:
+- ready:   the PDF exists in the cache
+- failed:  a <key>.err marker exists (e.g. WeasyPrint native libs missing)
+- pending: the job is queued or running in this worker
+- unknown: not started here; it may be running in another worker
+
+Configuration:
+- PDF_RENDER_WORKERS: pool size per gunicorn worker (0 renders inline)
+- PDF_RENDER_MAX_QUEUE: max jobs in flight per gunicorn worker
+
+Pool processes load the renderer when they start (pdf_renderer.warm_up);
+start() launches them ahead of the first download.
+
+stats() reports per-worker counters, including the total render time,
+for /healthz and /metrics.
+"""
+
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import instrumentation
+import pdf_cache
+import pdf_renderer
+
+MAX_WORKERS = int(os.getenv('PDF_RENDER_WORKERS') or 2)
+MAX_QUEUE = int(os.getenv('PDF_RENDER_MAX_QUEUE') or 32)
+
+_JOB_ID_RE = re.compile(r'^[0-9a-f]{64}$')
+
+_lock = threading.Lock()
+_executor = None
+_jobs = {}
+_stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0, 'render_seconds': 0.0}
+
+
+class QueueFull(Exception):
+    """Raised when too many renders are already in flight in this worker."""
+
+
+def is_valid_job_id(job_id):
+    return bool(_JOB_ID_RE.match(job_id or ''))
+
+
+def error_path(job_id):
+    return os.path.join(pdf_cache.CACHE_DIR, f'{job_id}.err')
+
+
+def render_pdf(source, job_id):
+    """Render `source` into the PDF cache under `job_id`; return the render time in seconds."""
+    started = time.perf_counter()
+    pdf_cache.store(job_id, lambda path: pdf_renderer.render(source, path))
+    return time.perf_counter() - started
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # 'spawn' keeps pool processes independent of the request worker's
+        # state (database connections, locks held by other threads).
+        _executor = ProcessPoolExecutor(
+            max_workers=MAX_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=pdf_renderer.warm_up,
+        )
+    return _executor
+
+
+def start(app=None):
+    """
+    Prepare this worker for its first download: compile the receipt
+    template of `app` and start the render processes (or warm up the
+    inline renderer).
+    """
+    if app is not None:
+        app.jinja_env.get_template(pdf_renderer.TEMPLATE_NAME)
+    if MAX_WORKERS <= 0 or pdf_renderer.ENGINE == 'direct':
+        return pdf_renderer.warm_up()
+    with _lock:
+        executor = _get_executor()
+        # Pool processes are spawned on demand, one per submitted task
+        for _ in range(MAX_WORKERS):
+            executor.submit(pdf_renderer.is_ready)
+    return True
+
+
+def _record_failure(job_id, error):
+    print(f"PDF render {job_id[:12]} failed:", error)
+    try:
+        os.makedirs(pdf_cache.CACHE_DIR, exist_ok=True)
+        with open(error_path(job_id), 'w', encoding='utf-8') as f:
+            f.write(str(error))
+        pdf_cache.track(error_path(job_id))
+    except OSError:
+        pass
+
+
+def _on_done(job_id, future):
+    global _executor
+    with _lock:
+        _jobs.pop(job_id, None)
+        error = future.exception()
+        _stats['failed' if error else 'completed'] += 1
+        if not error:
+            _stats['render_seconds'] += future.result()
+        if isinstance(error, BrokenProcessPool):
+            # A pool process died (e.g. OOM-killed); start a fresh pool next time
+            _executor = None
+    if error:
+        _record_failure(job_id, error)
+
+
+def status(job_id):
+    """Return 'ready', 'failed', 'pending' or 'unknown' for a job id."""
+    if os.path.exists(pdf_cache.path_for(job_id)):
+        return 'ready'
+    if os.path.exists(error_path(job_id)):
+        return 'failed'
+    with _lock:
+        if job_id in _jobs:
+            return 'pending'
+    return 'unknown'
+
+
+def clear_failure(job_id):
+    """Forget a failed render so that the next request retries it."""
+    try:
+        os.remove(error_path(job_id))
+    except FileNotFoundError:
+        pass
+
+
+def render_now(source, job_id):
+    """Render in the calling process, recording the outcome like a pool job."""
+    with _lock:
+        _stats['submitted'] += 1
+    try:
+        with instrumentation.timed('pdf'):
+            seconds = render_pdf(source, job_id)
+    except Exception as e:
+        with _lock:
+            _stats['failed'] += 1
+        _record_failure(job_id, e)
+    else:
+        with _lock:
+            _stats['completed'] += 1
+            _stats['render_seconds'] += seconds
+    return job_id
+
+
+def submit(source, job_id):
+    """
+    Queue a render of `source` (see pdf_renderer.render) under `job_id`
+    unless it is ready or in flight.
+
+    With PDF_RENDER_WORKERS=0 or the direct engine (faster than a round
+    trip to the pool) the render runs inline before returning.
+    Raises QueueFull when PDF_RENDER_MAX_QUEUE jobs are already in flight.
+    """
+    if status(job_id) in ('ready', 'failed'):
+        return job_id
+
+    if MAX_WORKERS <= 0 or pdf_renderer.ENGINE == 'direct':
+        return render_now(source, job_id)
+
+    global _executor
+    with _lock:
+        if job_id in _jobs:
+            return job_id
+        if len(_jobs) >= MAX_QUEUE:
+            _stats['rejected'] += 1
+            raise QueueFull()
+        try:
+            future = _get_executor().submit(render_pdf, source, job_id)
+        except BrokenProcessPool:
+            _executor = None
+            future = _get_executor().submit(render_pdf, source, job_id)
+        _jobs[job_id] = future
+        _stats['submitted'] += 1
+    future.add_done_callback(lambda f: _on_done(job_id, f))
+    return job_id
+
+
+def wait(job_id, timeout=60.0, interval=0.05):
+    """Block until a job is ready or failed; return its final status."""
+    with _lock:
+        future = _jobs.get(job_id)
+    if future is not None:
+        try:
+            future.result(timeout=timeout)
+        except Exception:
+            pass
+    deadline = time.monotonic() + timeout
+    while True:
+        state = status(job_id)
+        if state in ('ready', 'failed') or time.monotonic() >= deadline:
+            return state
+        time.sleep(interval)
+
+
+def stats():
+    """Queue metrics for this gunicorn worker."""
+    with _lock:
+        return {
+            'workers': MAX_WORKERS,
+            'max_queue': MAX_QUEUE,
+            'queue_depth': len(_jobs),
+            **_stats,
+        }
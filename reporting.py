@@ -0,0 +1,149 @@
+"""
+Reporting queries for the Marate AI Financial Management System.
+
+Aggregations are pushed into the database so that dashboard cost depends on
+the number of months, not on the number of receipts and expenses ever
+recorded. The dashboard reads the MonthlyRollup table (see rollup.py);
+monthly_summary_from_base() aggregates the base tables directly, and
+base_sums_by_user() runs the same aggregation per user for rollup.verify()
+and rollup.rebuild(). Month buckets are computed with the native date
+functions of the active dialect:
+- PostgreSQL: to_char(date_trunc('month', date), 'YYYY-MM')
+- SQLite: strftime('%Y-%m', date)
+"""
+
+import hashlib
+
+from sqlalchemy import BigInteger, cast, func, literal, select, union_all
+
+from database import db, Receipt, Expense, MonthlyRollup
+
+
+def month_bucket(column):
+    """Return a SQL expression that renders `column` as a 'YYYY-MM' string."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return func.to_char(func.date_trunc('month', column), 'YYYY-MM')
+    return func.strftime('%Y-%m', column)
+
+
+def amount_sum(column):
+    """
+    SUM of a whole-franc amount column, typed as an integer on every dialect.
+
+    PostgreSQL returns SUM(bigint) as numeric (a Python Decimal); the cast
+    keeps results exact integers without per-row conversion.
+    """
+    return cast(func.sum(column), BigInteger)
+
+
+def _monthly_sums(model, amount_column, kind, user_id, by_user=False):
+    month = month_bucket(model.date)
+    groups = [model.user_id, month] if by_user else [month]
+    query = select(
+        *groups[:-1],
+        month.label('month'),
+        literal(kind).label('kind'),
+        amount_sum(amount_column).label('total'),
+    ).where(model.date.isnot(None))
+    if user_id is not None:
+        query = query.where(model.user_id == user_id)
+    return query.group_by(*groups)
+
+
+def _base_sums_query(user_id=None, by_user=False):
+    return union_all(
+        _monthly_sums(Receipt, Receipt.price, 'income', user_id, by_user),
+        _monthly_sums(Expense, Expense.amount, 'expense', user_id, by_user),
+    )
+
+
+def monthly_summary(user_id=None):
+    """
+    Compute dashboard totals and monthly series from the MonthlyRollup table.
+
+    Pass a user id for the personal view, or None for company-wide data.
+    Reads one row per month (per user in the company view).
+    """
+    query = select(
+        MonthlyRollup.month,
+        amount_sum(MonthlyRollup.income),
+        amount_sum(MonthlyRollup.expenses),
+    ).group_by(MonthlyRollup.month)
+    if user_id is not None:
+        query = query.where(MonthlyRollup.user_id == user_id)
+
+    income_by_month = {}
+    expenses_by_month = {}
+    for month, income, expenses in db.session.execute(query):
+        if income:
+            income_by_month[month] = income
+        if expenses:
+            expenses_by_month[month] = expenses
+
+    return summarize_months(income_by_month, expenses_by_month)
+
+
+def data_version(user_id=None):
+    """
+    Return a cheap marker of the dashboard data of a scope.
+
+    Every receipt/expense write that changes an aggregate touches a rollup
+    row (bumping its updated_at), and rebuilds rewrite all rows, so the row
+    count and latest update time change whenever the summary would.
+    """
+    query = select(func.count(MonthlyRollup.id), func.max(MonthlyRollup.updated_at))
+    if user_id is not None:
+        query = query.where(MonthlyRollup.user_id == user_id)
+    count, last_update = db.session.execute(query).one()
+    return f"{count}:{last_update.isoformat() if last_update else '-'}"
+
+
+def dashboard_etag(user_id=None):
+    """Strong ETag of the /api/dashboard payload for a scope."""
+    scope = 'company' if user_id is None else f'user-{user_id}'
+    marker = f"dashboard-v2:{scope}:{data_version(user_id)}"
+    return hashlib.sha1(marker.encode('utf-8')).hexdigest()
+
+
+def monthly_summary_from_base(user_id=None):
+    """
+    Compute dashboard totals and monthly series from the base tables in a
+    single round-trip.
+
+    Pass a user id for the personal view, or None for company-wide data.
+    Returns a dict with total_income, total_expenses, net_income,
+    monthly_income_data and monthly_net_data, the series being lists of
+    ('YYYY-MM', amount) tuples sorted by month.
+    """
+    income_by_month = {}
+    expenses_by_month = {}
+    for month, kind, total in db.session.execute(_base_sums_query(user_id)):
+        target = income_by_month if kind == 'income' else expenses_by_month
+        target[month] = total or 0
+
+    return summarize_months(income_by_month, expenses_by_month)
+
+
+def base_sums_by_user():
+    """Return {(user_id, month): [income, expenses]} of the base tables, in a single round-trip."""
+    sums = {}
+    for user_id, month, kind, total in db.session.execute(_base_sums_query(by_user=True)):
+        sums.setdefault((user_id, month), [0, 0])[0 if kind == 'income' else 1] = total or 0
+    return sums
+
+
+def summarize_months(income_by_month, expenses_by_month):
+    """Build totals and sorted series from per-month income/expense sums."""
+    all_months = sorted(set(income_by_month) | set(expenses_by_month))
+    total_income = sum(income_by_month.values())
+    total_expenses = sum(expenses_by_month.values())
+    return {
+        'total_income': total_income,
+        'total_expenses': total_expenses,
+        'net_income': total_income - total_expenses,
+        'monthly_income_data': [(m, income_by_month.get(m, 0)) for m in all_months],
+        'monthly_net_data': [
+            (m, income_by_month.get(m, 0) - expenses_by_month.get(m, 0)) for m in all_months
+        ],
+    }
@@ -0,0 +1,133 @@
+"""
+Maintenance of the MonthlyRollup table.
+
+Every write to Receipt or Expense calls one of the record_* helpers before
+the session is committed, so the rollup changes land in the same
+transaction as the base row. Edits are handled by removing the old values
+(sign=-1) before mutating the row and adding the new ones afterwards, which
+also moves amounts between months when the date changes. Deltas are
+applied with an upsert, so concurrent first writes of a month add up
+instead of conflicting on the (user_id, month) constraint.
+
+rebuild() and verify() reconcile the table against the base tables.
+"""
+
+from datetime import datetime
+
+from database import db, Receipt, Expense, MonthlyRollup
+from reporting import base_sums_by_user
+
+
+def month_key(dt):
+    """Return the 'YYYY-MM' rollup key for a datetime."""
+    return dt.strftime('%Y-%m')
+
+
+def _insert(dialect):
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(MonthlyRollup)
+
+
+def apply_delta(user_id, month, income=0, expenses=0):
+    """Add income/expense deltas to the (user_id, month) rollup row."""
+    if not income and not expenses:
+        return
+    now = datetime.now()
+    if user_id is None:
+        # NULLs never conflict in uq_monthly_rollup_user_month: update or add
+        # the row through the session (unassigned data is only written by
+        # reassign_user)
+        row = MonthlyRollup.query.filter(
+            MonthlyRollup.user_id.is_(None), MonthlyRollup.month == month).with_for_update().first()
+        if row is None:
+            row = MonthlyRollup(user_id=None, month=month, income=0, expenses=0)
+            db.session.add(row)
+        row.income = (row.income or 0) + income
+        row.expenses = (row.expenses or 0) + expenses
+        row.updated_at = now
+        return
+    # A single upsert, so concurrent first writes of a month do not both insert
+    statement = _insert(db.session.get_bind().dialect.name).values(
+        user_id=user_id, month=month, income=income, expenses=expenses, updated_at=now)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=['user_id', 'month'],
+        set_={
+            'income': MonthlyRollup.income + statement.excluded.income,
+            'expenses': MonthlyRollup.expenses + statement.excluded.expenses,
+            'updated_at': statement.excluded.updated_at,
+        },
+    ))
+
+
+def record_receipt(receipt, sign=1):
+    """Add (sign=1) or remove (sign=-1) a receipt's price from its month."""
+    if receipt.date is None or receipt.price is None:
+        return
+    apply_delta(receipt.user_id, month_key(receipt.date), income=sign * receipt.price)
+
+
+def record_expense(expense, sign=1):
+    """Add (sign=1) or remove (sign=-1) an expense's amount from its month."""
+    if expense.date is None or expense.amount is None:
+        return
+    apply_delta(expense.user_id, month_key(expense.date), expenses=sign * expense.amount)
+
+
+def reassign_user(old_user_id, new_user_id=None):
+    """Move all rollup amounts of a user to another user (or to NULL)."""
+    rows = MonthlyRollup.query.filter(MonthlyRollup.user_id == old_user_id).all()
+    for row in rows:
+        income, expenses, month = row.income, row.expenses, row.month
+        db.session.delete(row)
+        db.session.flush()
+        apply_delta(new_user_id, month, income=income, expenses=expenses)
+
+
+def rebuild():
+    """
+    Recompute the whole rollup table from receipts and expenses. Returns the
+    row count. The changes are flushed, not committed: callers (the CLI, a
+    migration) commit them with the rest of their transaction.
+    """
+    sums = base_sums_by_user()
+    MonthlyRollup.query.delete()
+    now = datetime.now()
+    db.session.add_all([
+        MonthlyRollup(user_id=user_id, month=month, income=income, expenses=expenses, updated_at=now)
+        for (user_id, month), (income, expenses) in sums.items()
+    ])
+    db.session.flush()
+    return len(sums)
+
+
+def verify():
+    """
+    Compare the rollup table with the base tables (amounts are exact integers).
+
+    Returns a list of (user_id, month, expected, actual) mismatches where
+    expected/actual are (income, expenses) tuples. An empty list means the
+    rollup is consistent.
+    """
+    expected = base_sums_by_user()
+    actual = {
+        (row.user_id, row.month): [row.income or 0, row.expenses or 0]
+        for row in MonthlyRollup.query.all()
+    }
+    mismatches = []
+    for key in sorted(set(expected) | set(actual), key=lambda k: (k[0] or 0, k[1])):
+        exp = expected.get(key, [0, 0])
+        act = actual.get(key, [0, 0])
+        if exp != act:
+            mismatches.append((key[0], key[1], tuple(exp), tuple(act)))
+    return mismatches
+
+
+def needs_rebuild():
+    """True when the rollup table is empty but receipts or expenses exist."""
+    if db.session.query(MonthlyRollup.id).first() is not None:
+        return False
+    return (db.session.query(Receipt.id).first() is not None
+            or db.session.query(Expense.id).first() is not None)
@@ -0,0 +1,292 @@
+"""
+Benchmark the hot request paths through the Flask test client.
+
+Usage:
+    python scripts/benchmark.py                                  # 1k receipts, SQLite
+    python scripts/benchmark.py --receipts 100000 --requests 200
+    python scripts/benchmark.py --database-url postgresql+psycopg://localhost/facturation_bench --receipts 1000000
+    python scripts/benchmark.py --baseline benchmarks/baseline.json   # exit 1 on regressions
+
+The database is seeded with scripts/seed_synthetic.py until it holds
+--receipts receipts. SQLite databases are kept in benchmarks/ and reused
+by later runs of the same size. Each endpoint is requested --warmup
+times, then --requests times to measure:
+- latency percentiles (ms)
+- SQL statements per request
+- peak Python memory per request (tracemalloc, in a separate pass so it
+  does not skew latencies)
+
+Results are written to a JSON file (--output, default
+benchmarks/<date>-<dialect>-<receipts>.json). With --baseline, an
+endpoint fails when it runs more queries than in the baseline, or when
+its p95 exceeds the baseline p95 by more than --tolerance (and by more
+than --slack-ms, which absorbs timer noise on sub-millisecond paths).
+
+PDFs are rendered inline (PDF_RENDER_WORKERS=0) into a temporary cache,
+so receipt_download measures a full render and receipt_download_cached
+a cache hit. The receipts created by the generate endpoint are deleted
+at the end of the run, so a reused database keeps --receipts receipts.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT, 'benchmarks')
+
+# Add parent directory to path so we can import app modules
+sys.path.insert(0, ROOT)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class QueryCounter:
+    """Counts SQL statements sent through an engine."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+def _endpoints(rng, receipt_ids, username, password):
+    """Return {name: callable(client) -> response} for the benchmarked paths."""
+    # Distinct receipts (uncached PDFs) as long as the pool lasts
+    cold_ids = itertools.cycle(rng.sample(receipt_ids, len(receipt_ids)))
+    cached_id = receipt_ids[0]
+
+    def generate(client):
+        return client.post('/generate', data={
+            'name': f"Client {rng.randrange(10000)}",
+            'payment_type': 'one_time',
+            'payment_reason': 'Benchmark',
+            'price': str(rng.randrange(5000, 500000, 500)),
+        })
+
+    return {
+        'login': lambda c: c.post('/login', data={'username': username, 'password': password}),
+        'dashboard': lambda c: c.get('/dashboard?view=company'),
+        'dashboard_api': lambda c: c.get('/api/dashboard?view=company'),
+        'generate': generate,
+        'receipt_download': lambda c: c.get(f'/receipt/download/{next(cold_ids)}'),
+        'receipt_download_cached': lambda c: c.get(f'/receipt/download/{cached_id}'),
+        'clients': lambda c: c.get('/clients'),
+        'client_search': lambda c: c.get('/api/clients/search?q=cab'),
+    }
+
+
+def _measure(client, call, counter, requests, warmup):
+    for _ in range(warmup):
+        call(client)
+
+    latencies, queries, statuses = [], [], {}
+    for _ in range(requests):
+        before = counter.count
+        started = time.perf_counter()
+        response = call(client)
+        latencies.append((time.perf_counter() - started) * 1000)
+        queries.append(counter.count - before)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        response.close()
+
+    # Memory pass: tracemalloc slows Python down, so it is not timed
+    peaks = []
+    tracemalloc.start()
+    for _ in range(max(1, min(requests, 10))):
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        call(client).close()
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        'requests': requests,
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'max_ms': round(latencies[-1], 3),
+        'queries': max(queries),
+        'queries_mean': round(sum(queries) / len(queries), 2),
+        'peak_memory_kb': round(max(peaks) / 1024, 1),
+        'status_codes': {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+def _seed(database_url, receipts, existing, seed):
+    missing = receipts - existing
+    if missing <= 0:
+        return
+    print(f"Seeding {missing:,} receipts...")
+    subprocess.run(
+        [sys.executable, os.path.join(ROOT, 'scripts', 'seed_synthetic.py'),
+         '--seed', str(seed), '--receipts', str(missing), '--expenses', str(missing // 4),
+         '--clients', str(max(50, missing // 200)), '--users', '5' if not existing else '0'],
+        env={**os.environ, 'DATABASE_URL': database_url}, check=True,
+    )
+
+
+def _delete_generated(app, last_id):
+    """Delete the receipts created during the run (ids above `last_id`) and their rollup amounts."""
+    import rollup
+    from database import db, Receipt
+
+    with app.app_context():
+        receipts = Receipt.query.filter(Receipt.id > last_id).all()
+        for receipt in receipts:
+            rollup.record_receipt(receipt, sign=-1)
+            db.session.delete(receipt)
+        db.session.commit()
+    return len(receipts)
+
+
+def compare(results, baseline, tolerance, slack_ms=0.0):
+    """Return a list of regression messages of `results` against `baseline`."""
+    failures = []
+    for name, current in results['endpoints'].items():
+        reference = baseline.get('endpoints', {}).get(name)
+        if not reference:
+            continue
+        if current['queries'] > reference['queries']:
+            failures.append(f"{name}: {current['queries']} queries per request (baseline {reference['queries']})")
+        limit = max(reference['p95_ms'] * (1 + tolerance), reference['p95_ms'] + slack_ms)
+        if current['p95_ms'] > limit:
+            failures.append(f"{name}: p95 {current['p95_ms']:.1f} ms (baseline {reference['p95_ms']:.1f} ms, "
+                            f"limit {limit:.1f} ms)")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--receipts', type=int, default=1000, help='receipts in the dataset (default: 1000)')
+    parser.add_argument('--database-url', help='database to benchmark (default: benchmarks/bench_<receipts>.db)')
+    parser.add_argument('--requests', type=int, default=50, help='measured requests per endpoint (default: 50)')
+    parser.add_argument('--warmup', type=int, default=5, help='unmeasured requests per endpoint (default: 5)')
+    parser.add_argument('--endpoints', help='comma-separated subset of endpoints to run')
+    parser.add_argument('--seed', type=int, default=42, help='random seed for data and requests (default: 42)')
+    parser.add_argument('--username', default='admin', help='account used for the requests (default: admin)')
+    parser.add_argument('--password', default='admin', help='its password (default: admin)')
+    parser.add_argument('--output', help='results file (default: benchmarks/<date>-<dialect>-<receipts>.json)')
+    parser.add_argument('--baseline', help='results file to compare against; exit 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed p95 increase over the baseline, as a fraction (default: 0.25)')
+    parser.add_argument('--slack-ms', type=float, default=2.0,
+                        help='allowed p95 increase in ms, for endpoints too fast for a relative limit (default: 2)')
+    args = parser.parse_args()
+
+    # Relative paths are those of the caller, not of the working directory below
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    database_url = args.database_url or f"sqlite:///{os.path.join(BENCH_DIR, f'bench_{args.receipts}.db')}"
+    workdir = tempfile.mkdtemp(prefix='facturation-bench-')
+    # Must be set before the app is imported
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['PDF_RENDER_WORKERS'] = '0'
+    os.environ['PDF_CACHE_DIR'] = os.path.join(workdir, 'pdf-cache')
+
+    # Count the data without the app; seed_synthetic.py creates the schema if needed
+    from sqlalchemy import create_engine, inspect, text
+    engine = create_engine(database_url)
+    with engine.connect() as conn:
+        existing = conn.execute(text('SELECT count(*) FROM receipt')).scalar() if inspect(conn).has_table('receipt') else 0
+    engine.dispose()
+    _seed(database_url, args.receipts, existing, args.seed)
+
+    from sqlalchemy import func
+
+    from app import app
+    from database import db, Receipt
+
+    # The HTML fallback of receipt downloads writes below the working directory
+    os.chdir(workdir)
+    rng = random.Random(args.seed)
+    with app.app_context():
+        counter = QueryCounter(db.engine)
+        dialect = db.engine.dialect.name
+        receipt_count = db.session.query(Receipt).count()
+        last_id = db.session.query(func.max(Receipt.id)).scalar() or 0
+        pool_size = min(receipt_count, args.requests + args.warmup + 10)
+        receipt_ids = [row[0] for row in db.session.query(Receipt.id).order_by(Receipt.id.desc()).limit(pool_size * 20)]
+        receipt_ids = rng.sample(receipt_ids, min(len(receipt_ids), pool_size))
+        db.session.remove()
+
+    endpoints = _endpoints(rng, receipt_ids, args.username, args.password)
+    selected = args.endpoints.split(',') if args.endpoints else list(endpoints)
+    unknown = set(selected) - set(endpoints)
+    if unknown:
+        print(f"❌ Unknown endpoints: {', '.join(sorted(unknown))} (available: {', '.join(endpoints)})")
+        return 2
+
+    client = app.test_client()
+    if client.post('/login', data={'username': args.username, 'password': args.password}).status_code != 302:
+        print(f"❌ Could not log in as {args.username!r}")
+        return 2
+
+    print(f"Benchmarking {dialect} with {receipt_count:,} receipts, {args.requests} requests per endpoint\n")
+    print(f"{'endpoint':<26}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'peak KB':>10}")
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'dialect': dialect,
+            'receipts': receipt_count,
+            'requests': args.requests,
+            'warmup': args.warmup,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'endpoints': {},
+    }
+    try:
+        for name in selected:
+            stats = _measure(client, endpoints[name], counter, args.requests, args.warmup)
+            results['endpoints'][name] = stats
+            print(f"{name:<26}{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}"
+                  f"{stats['queries']:>9}{stats['peak_memory_kb']:>10.0f}")
+    finally:
+        deleted = _delete_generated(app, last_id)
+        if deleted:
+            print(f"\n✓ Deleted the {deleted:,} receipts created by the run")
+
+    output = output or os.path.join(
+        BENCH_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{dialect}-{receipt_count}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✓ Results written to {output}")
+
+    if baseline_path:
+        with open(baseline_path, encoding='utf-8') as f:
+            failures = compare(results, json.load(f), args.tolerance, args.slack_ms)
+        if failures:
+            print("\n❌ Regressions against the baseline:")
+            for failure in failures:
+                print(f"  - {failure}")
+            return 1
+        print("✓ No regression against the baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
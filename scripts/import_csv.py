@@ -0,0 +1,65 @@
+"""
+Import expenses or receipts from a CSV file.
+
+Usage:
+    python scripts/import_csv.py expenses releve-2025.csv --user admin
+    python scripts/import_csv.py receipts recus.csv --user admin --dry-run
+    python scripts/import_csv.py expenses releve.csv --encoding cp1252
+
+The file is streamed and written in batches (one transaction each), so
+it can be of any size. Rows already in the database and repeated rows
+are skipped, invalid rows are reported with their line number; see
+imports.py for the expected columns.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Add parent directory to path so we can import app modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('kind', choices=['expenses', 'receipts'], help='type of the rows')
+    parser.add_argument('path', help='CSV file')
+    parser.add_argument('--user', default='admin', help='username that owns the imported rows')
+    parser.add_argument('--encoding', default='utf-8-sig', help='file encoding (default: UTF-8)')
+    parser.add_argument('--batch-size', type=int, default=5000, help='rows per transaction (default: 5000)')
+    parser.add_argument('--dry-run', action='store_true', help='validate and check duplicates only')
+    args = parser.parse_args()
+
+    from app import app
+    from database import User
+    import imports
+
+    with app.app_context():
+        user = User.query.filter_by(username=args.user).first()
+        if not user:
+            print(f"❌ Unknown user {args.user!r}")
+            return 2
+
+        started = time.perf_counter()
+        try:
+            with open(args.path, encoding=args.encoding, newline='') as f:
+                report = imports.import_csv(f, args.kind, user.id, batch_size=args.batch_size,
+                                            dry_run=args.dry_run)
+        except (OSError, ValueError) as e:
+            print(f"❌ {e}")
+            return 2
+
+        for line, message in report['errors']:
+            print(f"  line {line}: {message}")
+        if report['error_count'] > len(report['errors']):
+            print(f"  ... and {report['error_count'] - len(report['errors'])} more errors")
+        verb = 'valid' if args.dry_run else 'imported'
+        print(f"{'✓' if not report['error_count'] else '❌'} {report['rows']} rows read, "
+              f"{report['imported']} {verb}, {report['duplicates']} duplicates skipped, "
+              f"{report['error_count']} errors in {time.perf_counter() - started:.2f}s")
+        return 1 if report['error_count'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
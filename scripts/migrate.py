@@ -0,0 +1,47 @@
+"""
+Apply or list the schema migrations of migrations.py.
+
+Usage:
+    python scripts/migrate.py            # apply pending migrations
+    python scripts/migrate.py status     # list applied and pending migrations
+
+Run it once per deploy, before the application workers start (the Docker
+image does this before launching gunicorn). Back up the database first
+(scripts/backup.sh).
+"""
+
+import os
+import sys
+
+# Add parent directory to path so we can import app modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+import migrations
+
+
+def main(argv):
+    command = argv[1] if len(argv) > 1 else 'upgrade'
+    if command not in ('upgrade', 'status'):
+        print(__doc__)
+        return 2
+
+    with app.app_context():
+        if command == 'status':
+            applied = migrations.applied_versions()
+            for version, name, _ in migrations.MIGRATIONS:
+                state = f"applied {applied[version]:%Y-%m-%d %H:%M}" if version in applied else "pending"
+                print(f"{version:04d} {name:<32} {state}")
+            return 0
+
+        try:
+            done = migrations.upgrade()
+        except Exception as e:
+            print(f"\n❌ Migration failed: {e}")
+            return 1
+        print("✓ Database is up to date" + (f" ({len(done)} migrations applied)" if done else ""))
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,71 @@
+"""
+Create the monthly recurring receipts of every active client.
+
+Usage:
+    python scripts/monthly_billing.py                 # current month
+    python scripts/monthly_billing.py --month 2025-11
+    python scripts/monthly_billing.py --month 2025-11 --user admin --no-render
+
+Clients already billed for the month are skipped, so the script can be
+re-run safely. The new PDFs are then rendered in parallel into the PDF
+cache (PDF_RENDER_WORKERS processes).
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+# Add parent directory to path so we can import app modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--month', default=datetime.now().strftime('%Y-%m'), help='billing month, YYYY-MM')
+    parser.add_argument('--user', default='admin', help='username that owns the new receipts')
+    parser.add_argument('--no-render', action='store_true', help='do not pre-render the PDFs')
+    args = parser.parse_args()
+
+    from app import app, queue_receipt_pdfs
+    from database import Receipt, User
+    import billing
+    import render_queue
+
+    try:
+        month_start = billing.parse_month(args.month)
+    except ValueError:
+        print(f"❌ Invalid month {args.month!r}, expected YYYY-MM")
+        return 2
+
+    with app.app_context():
+        user = User.query.filter_by(username=args.user).first()
+        if not user:
+            print(f"❌ Unknown user {args.user!r}")
+            return 2
+
+        started = time.perf_counter()
+        result = billing.run_monthly_billing(month_start, user_id=user.id)
+        print(f"✓ {len(result['created'])} receipts created for {args.month} "
+              f"in {time.perf_counter() - started:.2f}s")
+        if result['skipped']:
+            print(f"  {len(result['skipped'])} clients already billed this month were skipped")
+
+        if args.no_render or not result['created']:
+            return 0
+
+        started = time.perf_counter()
+        receipts = Receipt.query.filter(Receipt.id.in_(result['created'])).order_by(Receipt.id).all()
+        failed = 0
+        # Submit in chunks that fit in the render queue, then wait for each chunk
+        for i in range(0, len(receipts), render_queue.MAX_QUEUE):
+            job_ids = queue_receipt_pdfs(receipts[i:i + render_queue.MAX_QUEUE])
+            failed += sum(render_queue.wait(job_id) != 'ready' for job_id in job_ids)
+        print(f"✓ {len(receipts) - failed} PDFs rendered in {time.perf_counter() - started:.2f}s"
+              + (f", {failed} failed" if failed else ""))
+        return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
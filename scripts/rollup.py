@@ -0,0 +1,49 @@
+"""
+Rebuild or verify the monthly rollup table used by the dashboard.
+
+Usage:
+    python scripts/rollup.py verify     # report mismatches, exit 1 if any
+    python scripts/rollup.py rebuild    # recompute from receipts and expenses
+
+The rollup is maintained incrementally by the application; run `verify`
+after manual SQL changes to receipts/expenses and `rebuild` if it reports
+differences.
+"""
+
+import os
+import sys
+
+# Add parent directory to path so we can import app modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+from database import db
+import rollup
+
+
+def main(argv):
+    command = argv[1] if len(argv) > 1 else 'verify'
+    if command not in ('verify', 'rebuild'):
+        print(__doc__)
+        return 2
+
+    with app.app_context():
+        if command == 'rebuild':
+            rows = rollup.rebuild()
+            db.session.commit()
+            print(f"✓ Monthly rollup rebuilt ({rows} rows)")
+            return 0
+
+        mismatches = rollup.verify()
+        if not mismatches:
+            print("✓ Monthly rollup matches receipts and expenses")
+            return 0
+        print(f"✗ {len(mismatches)} mismatching rollup rows:")
+        for user_id, month, expected, actual in mismatches:
+            print(f"  user={user_id} month={month} expected={expected} actual={actual}")
+        print("Run `python scripts/rollup.py rebuild` to fix.")
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
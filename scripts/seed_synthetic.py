@@ -0,0 +1,323 @@
+"""
+Generate synthetic users, clients, receipts and expenses for load testing.
+
+Usage:
+    python scripts/seed_synthetic.py                                # small dataset, appended
+    python scripts/seed_synthetic.py --receipts 5000000 --expenses 1000000 --clients 5000
+    python scripts/seed_synthetic.py --reset --seed 7 --months 36
+
+Data is appended to the existing database by default. --reset first
+deletes all receipts, expenses and clients, and the users created by a
+previous run (⚠️ development databases only). Dates end at the current
+month; on a given day the same --seed produces the same dataset.
+
+Distributions are modelled on real usage:
+- Activity grows over the period, so recent months have more receipts
+- Most receipts are monthly payments of active clients at their rate,
+  the others one-time payments with varied amounts
+- A few users create most of the receipts
+
+Rows are written in batches of --batch-size, one transaction each: COPY
+on PostgreSQL (psycopg 3) and executemany INSERTs otherwise. Receipt
+numbers come from the regular allocator (numbering.py), and the monthly
+rollup is rebuilt at the end.
+"""
+
+import argparse
+import calendar
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+# Add parent directory to path so we can import app modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+USER_PREFIX = 'synthetic_'
+
+CLIENT_TYPES = ['Cabinet dentaire', 'Cabinet médical', 'Clinique', 'Pharmacie', 'Laboratoire', 'Cabinet de kinésithérapie']
+SURNAMES = ['Diallo', 'Traoré', 'Keita', 'Coulibaly', 'Koné', 'Diarra', 'Sangaré', 'Touré', 'Cissé', 'Camara',
+            'Dembélé', 'Sissoko', 'Konaté', 'Ba', 'Sow', 'Ndiaye', 'Fofana', 'Bah', 'Maïga', 'Dupont']
+STREETS = ['Avenue de la Liberté', 'Rue du Commerce', 'Boulevard du Peuple', 'Route de Koulikoro', 'Rue 312',
+           'Avenue Cheick Zayed', 'Rue de la Santé', 'Boulevard de l\'Indépendance']
+CITIES = ['Bamako', 'Dakar', 'Abidjan', 'Ouagadougou', 'Sikasso', 'Ségou']
+MONTHLY_RATES = [(15000, 10), (20000, 20), (25000, 30), (30000, 15), (50000, 15), (75000, 6), (100000, 4)]
+INSTALLATION_FEES = [(0, 40), (50000, 30), (100000, 20), (250000, 10)]
+CLIENT_STATUSES = [('active', 85), ('stopped', 10), ('pending', 5)]
+ONE_TIME_REASONS = ['Installation', 'Formation du personnel', 'Maintenance', 'Migration de données',
+                    'Configuration réseau', 'Support technique', 'Licence supplémentaire', 'Audit']
+EXPENSE_CATEGORIES = [
+    ('Fournitures de bureau', 5000, 25000, 20),
+    ('Abonnement logiciel', 10000, 50000, 15),
+    ('Hébergement web', 10000, 50000, 10),
+    ('Internet', 15000, 40000, 10),
+    ('Électricité', 20000, 90000, 10),
+    ('Location bureau', 100000, 300000, 5),
+    ('Marketing digital', 50000, 150000, 8),
+    ('Transport', 2000, 20000, 15),
+    ('Frais bancaires', 1000, 10000, 7),
+]
+
+RECEIPT_COLUMNS = ['receipt_number', 'customer_name', 'description', 'payment_type', 'payment_reason',
+                   'price', 'amount_in_letters', 'date', 'user_id', 'client_id']
+EXPENSE_COLUMNS = ['description', 'amount', 'date', 'user_id']
+CLIENT_COLUMNS = ['name', 'type', 'address', 'start_date', 'installation_fee', 'monthly_payment',
+                  'status', 'end_date', 'created_at', 'name_key', 'search_key']
+
+
+def _weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def _month_starts(months, today):
+    """First day of each of the last `months` months, oldest first."""
+    year, month = today.year, today.month
+    starts = []
+    for _ in range(months):
+        starts.append(date(year, month, 1))
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return starts[::-1]
+
+
+def _spread(total, months, growth):
+    """Split `total` rows over months with linearly growing weights."""
+    weights = [1 + growth * i / max(1, months - 1) for i in range(months)]
+    counts = [int(total * w / sum(weights)) for w in weights]
+    counts[-1] += total - sum(counts)
+    return counts
+
+
+def _random_datetimes(rng, month_start, count, today):
+    """`count` sorted datetimes within the month (business hours), never after `today`."""
+    days = calendar.monthrange(month_start.year, month_start.month)[1]
+    if (month_start.year, month_start.month) == (today.year, today.month):
+        days = today.day
+    start = datetime(month_start.year, month_start.month, 1, 8)
+    offsets = sorted(rng.randrange(days * 10 * 3600) for _ in range(count))
+    return [start + timedelta(days=offset // 36000, seconds=offset % 36000) for offset in offsets]
+
+
+class _Progress:
+    def __init__(self, label, total):
+        self.label = label
+        self.total = total
+        self.done = 0
+        self.started = time.perf_counter()
+
+    def update(self, count):
+        self.done += count
+        elapsed = time.perf_counter() - self.started
+        rate = self.done / elapsed if elapsed else 0
+        print(f"\r  {self.label}: {self.done:,}/{self.total:,} ({rate:,.0f} rows/s)", end='', flush=True)
+
+    def finish(self):
+        print(f"\r✓ {self.label}: {self.done:,} rows in {time.perf_counter() - self.started:.1f}s" + ' ' * 20)
+
+
+class _BatchWriter:
+    """Writes row tuples of one table: COPY on PostgreSQL/psycopg 3, executemany INSERTs otherwise."""
+
+    def __init__(self, engine, table, columns, use_copy):
+        self.engine = engine
+        self.table = table
+        self.columns = columns
+        self.use_copy = use_copy and engine.dialect.name == 'postgresql' and engine.dialect.driver == 'psycopg'
+
+    def write(self, rows):
+        from sqlalchemy import insert
+
+        with self.engine.begin() as conn:
+            if self.use_copy:
+                cursor = conn.connection.dbapi_connection.cursor()
+                with cursor.copy(f"COPY {self.table.name} ({', '.join(self.columns)}) FROM STDIN") as copy:
+                    for row in rows:
+                        copy.write_row(row)
+            else:
+                conn.execute(insert(self.table), [dict(zip(self.columns, row)) for row in rows])
+
+
+def _write_batched(writer, rows, batch_size, progress):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            writer.write(batch)
+            progress.update(len(batch))
+            batch = []
+    if batch:
+        writer.write(batch)
+        progress.update(len(batch))
+    progress.finish()
+
+
+def _ensure_users(count, seed):
+    """Create the synthetic users that do not exist yet; return the ids of all of them."""
+    from werkzeug.security import generate_password_hash
+    from database import db, User
+
+    names = [f"{USER_PREFIX}{seed}_{i:03d}" for i in range(count)]
+    existing = {user.username: user.id for user in User.query.filter(User.username.in_(names))}
+    # Hashing is deliberately slow: every synthetic user shares the password 'synthetic'
+    password_hash = generate_password_hash('synthetic') if len(existing) < len(names) else None
+    new_users = [User(username=name, password_hash=password_hash) for name in names if name not in existing]
+    db.session.add_all(new_users)
+    db.session.commit()
+    existing.update({user.username: user.id for user in new_users})
+    return [existing[name] for name in names]
+
+
+def _client_rows(rng, count, month_starts, now, first_number=1):
+    # Bulk inserts bypass the ORM hook that sets the search keys
+    from database import client_search_keys
+
+    for i in range(first_number, first_number + count):
+        surname = rng.choice(SURNAMES)
+        client_type = rng.choice(CLIENT_TYPES)
+        start = rng.choice(month_starts) + timedelta(days=rng.randrange(28))
+        status = _weighted(rng, CLIENT_STATUSES)
+        end = start + timedelta(days=rng.randrange(30, 720)) if status == 'stopped' else None
+        name = f"{client_type} {surname} {i}"
+        address = f"{rng.randrange(1, 400)} {rng.choice(STREETS)}, {rng.choice(CITIES)}"
+        yield (
+            name,
+            client_type,
+            address,
+            start,
+            _weighted(rng, INSTALLATION_FEES),
+            _weighted(rng, MONTHLY_RATES),
+            status,
+            end if end and end < now.date() else None,
+            now,
+            *client_search_keys(name, client_type, address),
+        )
+
+
+def _receipt_rows(rng, count, month_starts, now, clients, user_ids, user_weights):
+    import billing
+    import numbering
+
+    letters = lru_cache(maxsize=None)(billing.amount_in_letters)
+    for month_start, month_count in zip(month_starts, _spread(count, len(month_starts), growth=3)):
+        if not month_count:
+            continue
+        numbers = numbering.allocate(month_count, month_start.year)
+        for number, when in zip(numbers, _random_datetimes(rng, month_start, month_count, now)):
+            if clients and rng.random() < 0.75:
+                name, rate, client_id = rng.choice(clients)
+                row = (name, billing.RECURRING_DESCRIPTION, 'recurring_monthly', None, rate)
+            else:
+                reason = rng.choice(ONE_TIME_REASONS)
+                name, _, client_id = rng.choice(clients) if clients else (f"Client {rng.choice(SURNAMES)}", 0, None)
+                price = int(rng.lognormvariate(11.3, 0.8)) // 500 * 500 + 500
+                row = (name, reason, 'one_time', reason, price)
+            name, description, payment_type, reason, price = row
+            yield (number, name, description, payment_type, reason, price, letters(price), when,
+                   rng.choices(user_ids, user_weights)[0], client_id)
+
+
+def _expense_rows(rng, count, month_starts, now, user_ids, user_weights):
+    categories = [(name, low, high) for name, low, high, _ in EXPENSE_CATEGORIES]
+    weights = [weight for *_, weight in EXPENSE_CATEGORIES]
+    for month_start, month_count in zip(month_starts, _spread(count, len(month_starts), growth=1)):
+        for when in _random_datetimes(rng, month_start, month_count, now):
+            description, low, high = rng.choices(categories, weights)[0]
+            yield (description, rng.randrange(low, high + 1, 500), when, rng.choices(user_ids, user_weights)[0])
+
+
+def _reset():
+    from database import db, Receipt, Expense, Client, MonthlyRollup, User
+    import client_cache
+
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(db.text('TRUNCATE monthly_rollup, receipt, expense, client'))
+    else:
+        for model in (MonthlyRollup, Receipt, Expense, Client):
+            db.session.execute(db.delete(model))
+    db.session.execute(db.delete(User).where(User.username.like(USER_PREFIX + '%')))
+    client_cache.bump()
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seed', type=int, default=42, help='random seed (default: 42)')
+    parser.add_argument('--users', type=int, default=5, help='synthetic users (default: 5)')
+    parser.add_argument('--clients', type=int, default=200, help='clients (default: 200)')
+    parser.add_argument('--receipts', type=int, default=10000, help='receipts (default: 10000)')
+    parser.add_argument('--expenses', type=int, default=3000, help='expenses (default: 3000)')
+    parser.add_argument('--months', type=int, default=24, help='months of history, ending this month (default: 24)')
+    parser.add_argument('--batch-size', type=int, default=5000, help='rows per transaction (default: 5000)')
+    parser.add_argument('--reset', action='store_true', help='delete existing receipts, expenses and clients first')
+    parser.add_argument('--no-copy', action='store_true', help='use INSERT batches on PostgreSQL too')
+    args = parser.parse_args()
+
+    from sqlalchemy import func, select
+
+    from app import app
+    from database import db, Receipt, Expense, Client, User
+    import client_cache
+    import migrations
+    import rollup
+
+    rng = random.Random(args.seed)
+    now = datetime.now().replace(microsecond=0)
+    month_starts = _month_starts(max(1, args.months), now)
+    started = time.perf_counter()
+
+    with app.app_context():
+        # Seeding an empty database creates its schema
+        migrations.upgrade()
+        engine = db.engine
+        print(f"Database engine: {engine.name}"
+              + (" (COPY)" if engine.name == 'postgresql' and not args.no_copy else " (batched INSERT)"))
+        if args.reset:
+            _reset()
+            print("✓ Existing receipts, expenses, clients and synthetic users deleted")
+
+        user_ids = _ensure_users(args.users, args.seed) if args.users else []
+        if not user_ids:
+            user_ids = [User.query.filter_by(username='admin').one().id]
+        # Zipf-like activity: the first users create most of the receipts
+        user_weights = [1 / (rank + 1) for rank in range(len(user_ids))]
+        print(f"✓ {len(user_ids)} users")
+
+        def writer(model, columns):
+            return _BatchWriter(engine, model.__table__, columns, use_copy=not args.no_copy)
+
+        # Number client names after the existing clients so that appended names stay distinct
+        first_number = db.session.query(Client).count() + 1
+        last_client_id = db.session.query(func.max(Client.id)).scalar() or 0
+        client_rows = list(_client_rows(rng, args.clients, month_starts, now, first_number))
+        if client_rows:
+            _write_batched(writer(Client, CLIENT_COLUMNS), client_rows, args.batch_size,
+                           _Progress('clients', len(client_rows)))
+            client_cache.bump()
+            db.session.commit()
+        # Rows are inserted in order, so the new ids follow the previous maximum in row order
+        new_ids = db.session.scalars(
+            select(Client.id).where(Client.id > last_client_id).order_by(Client.id)).all()
+        active_clients = [(row[0], row[5], client_id) for row, client_id in zip(client_rows, new_ids)
+                          if row[6] == 'active']
+
+        _write_batched(writer(Receipt, RECEIPT_COLUMNS),
+                       _receipt_rows(rng, args.receipts, month_starts, now, active_clients, user_ids, user_weights),
+                       args.batch_size, _Progress('receipts', args.receipts))
+        _write_batched(writer(Expense, EXPENSE_COLUMNS),
+                       _expense_rows(rng, args.expenses, month_starts, now, user_ids, user_weights),
+                       args.batch_size, _Progress('expenses', args.expenses))
+
+        rollup_started = time.perf_counter()
+        rows = rollup.rebuild()
+        db.session.commit()
+        print(f"✓ Monthly rollup rebuilt ({rows} rows) in {time.perf_counter() - rollup_started:.1f}s")
+        print(f"\n✅ Done in {time.perf_counter() - started:.1f}s "
+              f"({db.session.query(Receipt).count():,} receipts, {db.session.query(Expense).count():,} expenses "
+              f"in the database)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+Check that client search ignores case and accents.
+
+Usage:
+    python scripts/verify_client_search.py
+
+Adds sample clients with accented names, types and addresses to the
+database configured by DATABASE_URL, runs client_search.search() for
+accented, unaccented and differently cased queries (short name prefixes
+and substrings served by the search index), then rolls the sample
+clients back. Exits 1 when a query misses its client or finds a client
+it should not.
+"""
+
+import os
+import sys
+from datetime import date
+
+# Add parent directory to path so we can import app modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+from database import db, Client
+import client_search
+
+# Searches are restricted to the samples, so existing clients cannot crowd them out
+STATUS = 'verify-search'
+
+SAMPLES = {
+    'eloise': Client(name='Éloïse Zéphyrin', type='Cabinet médical', address='12 rue de Ségou, Bamako',
+                     start_date=date(2025, 1, 1), status=STATUS),
+    'francois': Client(name='Clinique François Œuvre', type='Clinique', address='Hamdallaye ACI 2000',
+                       start_date=date(2025, 1, 1), status=STATUS),
+}
+
+# (query, sample expected among the results, sample that must not be found)
+CASES = [
+    ('Él', 'eloise', None),
+    ('él', 'eloise', None),
+    ('el', 'eloise', None),
+    ('ÉLOÏSE', 'eloise', None),
+    ('eloi', 'eloise', None),
+    ('zephyrin', 'eloise', 'francois'),
+    ('  éloïse   zéphyrin ', 'eloise', None),
+    ('medical', 'eloise', 'francois'),
+    ('segou', 'eloise', 'francois'),
+    ('SÉGOU', 'eloise', None),
+    ('françois', 'francois', 'eloise'),
+    ('francois', 'francois', 'eloise'),
+    ('œuvre', 'francois', None),
+    ('eloix', None, 'eloise'),
+]
+
+
+def main():
+    failures = []
+    with app.app_context():
+        try:
+            db.session.add_all(SAMPLES.values())
+            db.session.flush()
+            for query, expected, unexpected in CASES:
+                found = {client.id for client in client_search.search(query, status=STATUS)}
+                if expected and SAMPLES[expected].id not in found:
+                    failures.append(f"{query!r} does not find {SAMPLES[expected].name!r}")
+                if unexpected and SAMPLES[unexpected].id in found:
+                    failures.append(f"{query!r} finds {SAMPLES[unexpected].name!r}")
+        finally:
+            db.session.rollback()
+
+    if failures:
+        print("❌ Client search:")
+        for failure in failures:
+            print(f"  - {failure}")
+        return 1
+    print(f"✓ {len(CASES)} accent and case checks passed")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+Check that the direct PDF engine prints the same text as the HTML template.
+
+Usage:
+    python scripts/verify_receipt_pdf.py              # sample receipts + latest 200 receipts
+    python scripts/verify_receipt_pdf.py --limit 5000
+
+For built-in sample receipts (long texts, accents, special characters)
+and the latest --limit receipts of the database, the words of
+receipt_template.html are compared with the words of the PDF written by
+receipt_pdf.py (RECEIPT_PDF_ENGINE=direct). Exits 1 on any difference,
+for example characters outside WinAnsi that the direct engine prints as
+'?'.
+
+Render times of both engines are reported (WeasyPrint only when it is
+installed).
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from html.parser import HTMLParser
+
+# Add parent directory to path so we can import app modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, render_receipt_html
+from database import Receipt
+import pdf_renderer
+import receipt_pdf
+
+SAMPLES = [
+    Receipt(receipt_number='REC-2025-000001', customer_name='Cabinet Dentaire Dupont', description='Abonnement mensuel',
+            payment_type='recurring_monthly', price=25000, amount_in_letters='vingt-cinq mille francs CFA',
+            date=datetime(2025, 1, 31, 9, 5)),
+    Receipt(receipt_number='REC-2025-000002', customer_name='Clinique « Sainte-Élise » (Ségou)',
+            description='Installation du réseau, configuration des postes, formation du personnel et '
+                        'migration des dossiers patients depuis l\'ancien logiciel — 3 jours sur site',
+            payment_type='one_time', payment_reason='Installation initiale (50 % à la commande)',
+            price=1250000, amount_in_letters='un million deux cent cinquante mille francs CFA',
+            date=datetime(2025, 12, 1, 18, 30)),
+    Receipt(receipt_number='REC-2026-000003', customer_name='A\\B & C <test>', description='x' * 200,
+            payment_type='one_time', payment_reason=None, price=0, amount_in_letters='zéro',
+            date=datetime(2026, 2, 28)),
+]
+
+
+class _TextExtractor(HTMLParser):
+    """Visible text of an HTML document (without <head>)."""
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self._in_head = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'head':
+            self._in_head = True
+        elif tag == 'br':
+            self.parts.append(' ')
+
+    def handle_endtag(self, tag):
+        if tag == 'head':
+            self._in_head = False
+
+    def handle_data(self, data):
+        if not self._in_head:
+            self.parts.append(data)
+
+
+def html_words(html):
+    parser = _TextExtractor()
+    parser.feed(html)
+    return ' '.join(parser.parts).split()
+
+
+def pdf_words(pdf):
+    return ' '.join(receipt_pdf.extract_text(pdf)).split()
+
+
+def _first_difference(expected, actual):
+    for i, (a, b) in enumerate(zip(expected, actual)):
+        if a != b:
+            return f"word {i}: {a!r} in HTML, {b!r} in PDF"
+    return f"HTML has {len(expected)} words, PDF {len(actual)}"
+
+
+def _time(render, receipts):
+    started = time.perf_counter()
+    for receipt in receipts:
+        render(receipt)
+    return (time.perf_counter() - started) * 1000 / max(1, len(receipts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--limit', type=int, default=200, help='latest receipts to check (default: 200)')
+    args = parser.parse_args()
+
+    with app.app_context():
+        receipts = SAMPLES + Receipt.query.order_by(Receipt.id.desc()).limit(args.limit).all()
+        failures = 0
+        for receipt in receipts:
+            expected = html_words(render_receipt_html(receipt))
+            actual = pdf_words(receipt_pdf.render(receipt_pdf.receipt_fields(receipt)))
+            if expected != actual:
+                failures += 1
+                print(f"❌ {receipt.receipt_number}: {_first_difference(expected, actual)}")
+        print(f"{'❌' if failures else '✓'} {len(receipts) - failures}/{len(receipts)} receipts print the same text")
+
+        direct_ms = _time(lambda r: receipt_pdf.render(receipt_pdf.receipt_fields(r)), receipts)
+        print(f"direct engine: {direct_ms:.2f} ms per receipt")
+        if pdf_renderer.warm_up('weasyprint'):
+            with tempfile.TemporaryDirectory() as tmp:
+                target = os.path.join(tmp, 'receipt.pdf')
+                weasy_ms = _time(lambda r: pdf_renderer.render(render_receipt_html(r), target, engine='weasyprint'),
+                                 receipts[:50])
+            print(f"weasyprint engine: {weasy_ms:.2f} ms per receipt ({weasy_ms / direct_ms:.0f}x)")
+        else:
+            print("weasyprint engine: not available")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
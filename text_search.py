@@ -0,0 +1,241 @@
+"""
+Full-text search over receipts and expenses.
+
+Receipts are searched by number, customer name, description and payment
+reason; expenses by description. Every word of the query must match a
+word of the record, the last one as a prefix (so results follow typing),
+ignoring case and accents ("recu" finds "Reçu"):
+- PostgreSQL: a search_vector tsvector column on receipt and expense,
+  filled by triggers with to_tsvector('simple', unaccent(...)), indexed
+  with GIN and ranked with ts_rank_cd (numbers and names weigh more
+  than descriptions)
+- SQLite: FTS5 tables (receipt_fts, expense_fts) with the unicode61
+  remove_diacritics tokenizer, kept in sync by triggers and ranked
+  with bm25
+
+The triggers also cover bulk inserts (monthly billing, the synthetic
+seeder), edits and deletes. ensure_index() creates the index objects and
+indexes existing rows; it is idempotent.
+
+Only the newest MAX_CANDIDATES matches of each table are ranked, so a
+word found in most records (e.g. "paiement") is not ranked across the
+whole table; full words are read incrementally from the index, and only
+the last (prefix) word has to be expanded. Without the index (no unaccent privileges or FTS5), search falls
+back to case-insensitive LIKE scans.
+"""
+
+import re
+
+from sqlalchemy import func, or_, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import joinedload
+
+from database import db, Receipt, Expense
+
+DEFAULT_PER_PAGE = 20
+MAX_PER_PAGE = 100
+MAX_CANDIDATES = 1000
+MAX_TERMS = 8
+KINDS = ('receipts', 'expenses')
+
+_WORD_RE = re.compile(r'[^\W_]+')
+
+_POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    "ALTER TABLE receipt ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    "ALTER TABLE expense ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    """CREATE OR REPLACE FUNCTION receipt_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        new.search_vector :=
+            setweight(to_tsvector('simple', unaccent(
+                coalesce(new.receipt_number, '') || ' ' || coalesce(new.customer_name, ''))), 'A') ||
+            setweight(to_tsvector('simple', unaccent(
+                coalesce(new.description, '') || ' ' || coalesce(new.payment_reason, ''))), 'B');
+        RETURN new;
+    END
+    $$ LANGUAGE plpgsql""",
+    """CREATE OR REPLACE FUNCTION expense_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        new.search_vector := setweight(to_tsvector('simple', unaccent(coalesce(new.description, ''))), 'B');
+        RETURN new;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS receipt_search_vector ON receipt",
+    "CREATE TRIGGER receipt_search_vector BEFORE INSERT OR UPDATE OF "
+    "receipt_number, customer_name, description, payment_reason ON receipt "
+    "FOR EACH ROW EXECUTE FUNCTION receipt_search_vector_update()",
+    "DROP TRIGGER IF EXISTS expense_search_vector ON expense",
+    "CREATE TRIGGER expense_search_vector BEFORE INSERT OR UPDATE OF description ON expense "
+    "FOR EACH ROW EXECUTE FUNCTION expense_search_vector_update()",
+    # Index the existing rows (fires the triggers)
+    "UPDATE receipt SET description = description WHERE search_vector IS NULL",
+    "UPDATE expense SET description = description WHERE search_vector IS NULL",
+    "CREATE INDEX IF NOT EXISTS ix_receipt_search ON receipt USING gin (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_expense_search ON expense USING gin (search_vector)",
+]
+
+_FTS_OPTIONS = "tokenize='unicode61 remove_diacritics 2', prefix='2 3'"
+_FTS_TABLES = {
+    'receipt_fts': ('receipt', ['receipt_number', 'customer_name', 'description', 'payment_reason']),
+    'expense_fts': ('expense', ['description']),
+}
+
+
+def _sqlite_ddl(fts_table, table, columns):
+    names = ', '.join(columns)
+    new_values = ', '.join(f'new.{column}' for column in columns)
+    old_values = ', '.join(f'old.{column}' for column in columns)
+    delete = (f"INSERT INTO {fts_table}({fts_table}, rowid, {names}) "
+              f"VALUES ('delete', old.id, {old_values});")
+    insert = f"INSERT INTO {fts_table}(rowid, {names}) VALUES (new.id, {new_values});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5("
+        f"{names}, content='{table}', content_rowid='id', {_FTS_OPTIONS})",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {table} BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {names} ON {table} "
+        f"BEGIN {delete} {insert} END",
+    ]
+
+
+# bm25 column weights, in the order of _FTS_TABLES
+_BM25 = {
+    'receipt_fts': 'bm25(receipt_fts, 10.0, 10.0, 2.0, 2.0)',
+    'expense_fts': 'bm25(expense_fts)',
+}
+
+_has_index = None
+
+
+def ensure_index():
+    """Create the search index and index existing rows. Returns False if unsupported."""
+    global _has_index
+    engine = db.engine
+    try:
+        with engine.begin() as conn:
+            if engine.dialect.name == 'postgresql':
+                for statement in _POSTGRES_DDL:
+                    conn.execute(text(statement))
+            else:
+                for fts_table, (table, columns) in _FTS_TABLES.items():
+                    exists = conn.execute(text(
+                        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                        {'name': fts_table}).first()
+                    for statement in _sqlite_ddl(fts_table, table, columns):
+                        conn.execute(text(statement))
+                    if not exists:
+                        conn.execute(text(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')"))
+        _has_index = True
+    except DBAPIError:
+        # No unaccent privileges or an SQLite build without FTS5: search
+        # still works, through sequential scans
+        _has_index = False
+    return bool(_has_index)
+
+
+def _index_available():
+    global _has_index
+    if _has_index is None:
+        if db.engine.dialect.name == 'postgresql':
+            found = db.session.execute(text(
+                "SELECT 1 FROM pg_indexes WHERE indexname = 'ix_receipt_search'")).first()
+        else:
+            found = db.session.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'receipt_fts'")).first()
+        _has_index = found is not None
+    return _has_index
+
+
+def terms(q):
+    """The words of a query, lowercased (at most MAX_TERMS)."""
+    return _WORD_RE.findall((q or '').lower())[:MAX_TERMS]
+
+
+def _user_filter(alias, user_id):
+    return f" AND {alias}.user_id = :user_id" if user_id is not None else ''
+
+
+def _sqlite_candidates(kind, user_id):
+    fts_table = 'receipt_fts' if kind == 'receipts' else 'expense_fts'
+    table = _FTS_TABLES[fts_table][0]
+    return (
+        f"SELECT * FROM (SELECT '{kind}' AS kind, {fts_table}.rowid AS id, -{_BM25[fts_table]} AS score "
+        f"FROM {fts_table} JOIN {table} ON {table}.id = {fts_table}.rowid "
+        f"WHERE {fts_table} MATCH :match{_user_filter(table, user_id)} "
+        f"ORDER BY {fts_table}.rowid DESC LIMIT :candidates)"
+    )
+
+
+def _postgres_candidates(kind, user_id):
+    table = 'receipt' if kind == 'receipts' else 'expense'
+    return (
+        f"(SELECT '{kind}' AS kind, id, ts_rank_cd(search_vector, query) AS score "
+        f"FROM {table}, to_tsquery('simple', unaccent(:match)) AS query "
+        f"WHERE search_vector @@ query{_user_filter(table, user_id)} "
+        f"ORDER BY id DESC LIMIT :candidates)"
+    )
+
+
+def _ranked_ids(words, kinds, user_id, offset, limit):
+    """[(kind, id)] of the page, best matches first, from the text index."""
+    if db.engine.dialect.name == 'postgresql':
+        match = ' & '.join(words[:-1] + [f'{words[-1]}:*'])
+        parts = [_postgres_candidates(kind, user_id) for kind in kinds]
+    else:
+        match = ' '.join([f'"{word}"' for word in words[:-1]] + [f'"{words[-1]}"*'])
+        parts = [_sqlite_candidates(kind, user_id) for kind in kinds]
+    statement = text(
+        ' UNION ALL '.join(parts) + ' ORDER BY score DESC, id DESC LIMIT :limit OFFSET :offset')
+    params = {'match': match, 'candidates': MAX_CANDIDATES, 'limit': limit, 'offset': offset}
+    if user_id is not None:
+        params['user_id'] = user_id
+    return [(kind, id_) for kind, id_, _ in db.session.execute(statement, params)]
+
+
+def _scan_ids(words, kinds, user_id, offset, limit):
+    """Fallback without the text index: LIKE on each column, newest first."""
+    queries = []
+    for kind in kinds:
+        model = Receipt if kind == 'receipts' else Expense
+        columns = ([Receipt.receipt_number, Receipt.customer_name, Receipt.description, Receipt.payment_reason]
+                   if kind == 'receipts' else [Expense.description])
+        query = db.session.query(model.id)
+        for word in words:
+            pattern = f'%{word}%'
+            query = query.filter(or_(*[func.lower(column).like(pattern) for column in columns]))
+        if user_id is not None:
+            query = query.filter(model.user_id == user_id)
+        queries.append((kind, query.order_by(model.id.desc()).limit(offset + limit)))
+    rows = [(kind, id_) for kind, query in queries for (id_,) in query]
+    rows.sort(key=lambda row: row[1], reverse=True)
+    return rows[offset:offset + limit]
+
+
+def search(q, kinds=KINDS, user_id=None, page=1, per_page=DEFAULT_PER_PAGE):
+    """
+    Return (results, has_next) for one page of the records matching `q`.
+
+    `kinds` selects 'receipts' and/or 'expenses', `user_id` restricts the
+    search to one user's records. Results are (kind, Receipt or Expense)
+    tuples, best matches first.
+    """
+    words = terms(q)
+    kinds = [kind for kind in KINDS if kind in kinds]
+    per_page = max(1, min(int(per_page or DEFAULT_PER_PAGE), MAX_PER_PAGE))
+    offset = (max(1, int(page or 1)) - 1) * per_page
+    if not words or not kinds or offset >= MAX_CANDIDATES:
+        return [], False
+
+    find = _ranked_ids if _index_available() else _scan_ids
+    ids = find(words, kinds, user_id, offset, per_page + 1)
+    has_next = len(ids) > per_page and offset + per_page < MAX_CANDIDATES
+    ids = ids[:per_page]
+
+    records = {}
+    for kind, model in (('receipts', Receipt), ('expenses', Expense)):
+        wanted = [id_ for row_kind, id_ in ids if row_kind == kind]
+        if wanted:
+            records.update(((kind, row.id), row) for row in
+                           model.query.options(joinedload(model.user)).filter(model.id.in_(wanted)))
+    results = [(kind, records[(kind, id_)]) for kind, id_ in ids if (kind, id_) in records]
+    return results, has_next